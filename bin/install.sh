@@ -73,12 +73,12 @@ if [[ OS_FREEBSD -gt 0 ]]; then
     fi
 
     echo "[INFO] Installing FreeBSD PKG dependencies..."
-    pkg install -y python34 wget git elasticsearch rabbitmq
+    pkg install -y python39 wget git elasticsearch rabbitmq
     if [[ $? -ne 0 ]]; then
         echo "[ERROR] Cannot FreeBSD PKG dependencies."
         exit 1
     fi
-    ln -s /usr/local/bin/python3.4 /usr/local/bin/python3
+    ln -s /usr/local/bin/python3.9 /usr/local/bin/python3
     echo "[OKAY] FreeBSD PKG Installed"
 
     echo "[INFO] Installing Python PIP for FreeBSD"
@@ -92,7 +92,7 @@ if [[ OS_FREEBSD -gt 0 ]]; then
 
 
     echo -n "[INFO] Installing Pip3 dependencies..."
-    scl enable rh-python34 -- pip3 -q install pygeoip feedparser tabulate pyyaml requests dnspython3 python-dateutil schedule beautifulsoup4 setproctitle watchdog pika
+    pip3 -q install pygeoip maxminddb feedparser tabulate pyyaml requests dnspython3 python-dateutil schedule beautifulsoup4 setproctitle watchdog pika
     if [[ $? -ne 0 ]]; then
         echo "[ERROR] Cannot Pip Install dependencies."
         exit
@@ -203,20 +203,22 @@ centos.x86_64.rpm
     fi
     echo "[OKAY] CentOS dependencies Installed"
 
-    echo "[INFO] Installing Python34 from SoftwareCollections..."
-    wget --no-check-certificate -O /tmp/rhscl-rh-python34-epel-7-x86_64.noarch.rpm https://www.softwarecollections.org/en/scls/rhscl/rh-python34/epel-7-x86_64/download/rhscl-rh-python34-epel-7-x86_64.noarch.rpm
-    rpm -i /tmp/rhscl-rh-python34-epel-7-x86_64.noarch.rpm
+    echo "[INFO] Installing Python38 from SoftwareCollections..."
+    if [[ OS_REDHAT -gt 0 ]]; then
+        subscription-manager repos --enable rhel-server-rhscl-7-rpms
+    else
+        yum -q -y install centos-release-scl
+    fi
     if [[ $? -ne 0 ]]; then
-        echo "[ERROR] Cannot install Python34 repository."
+        echo "[ERROR] Cannot install Python38 repository."
         exit
     fi
-    rm -f /tmp/rhscl-rh-python34-epel-7-x86_64.noarch.rpm
-    yum -q -y install rh-python34 erlang
+    yum -q -y install rh-python38 erlang
     if [[ $? -ne 0 ]]; then
-        echo "[ERROR] Cannot install Python34 packages."
+        echo "[ERROR] Cannot install Python38 packages."
         exit
     fi
-    echo "[OKAY] Installed Python34"
+    echo "[OKAY] Installed Python38"
 
     echo -n "[INFO] Installing RabbitMQ-Server"
     wget --no-check-certificate -O /tmp/rabbitmq-server-3.3.5-1.noarch.rpm https://www.rabbitmq.com/releases/rabbitmq-server/v3.3.5/rabbitmq-server-3.3.5-1.noarch.rpm
@@ -231,7 +233,7 @@ centos.x86_64.rpm
     /sbin/service rabbitmq-server start
 
     echo -n "[INFO] Installing Pip3 dependencies..."
-    scl enable rh-python34 -- pip3 -q install pygeoip feedparser tabulate pyyaml requests dnspython3 python-dateutil schedule beautifulsoup4 setproctitle watchdog pika
+    scl enable rh-python38 -- pip3 -q install pygeoip maxminddb feedparser tabulate pyyaml requests dnspython3 python-dateutil schedule beautifulsoup4 setproctitle watchdog pika
     if [[ $? -ne 0 ]]; then
         echo "[ERROR] Cannot Pip Install dependencies."
         exit
@@ -282,17 +284,17 @@ centos.x86_64.rpm
     cp /usr/local/cifpy3/scripts/centos/cif-server.sysconfig /etc/sysconfig/cif-server
 
     # Download GeoIP data
-    scl enable rh-python34 -- /usr/local/cifpy3/bin/cif-utility --geoip
+    scl enable rh-python38 -- /usr/local/cifpy3/bin/cif-utility --geoip
 
     # Run the cif initial install
-    TOKEN=$(scl enable rh-python34 -- /usr/local/cifpy3/bin/cif-utility --install)
+    TOKEN=$(scl enable rh-python38 -- /usr/local/cifpy3/bin/cif-utility --install)
 
     # Write the token out to ~/.cif
     echo "${TOKEN}" > ~/.cif
 
     # Add CIF to everyone's $PATH (also add it to running shell)
-    echo "alias cif='scl enable rh-python34 -- /usr/local/cifpy3/bin/cif'" > /etc/profile.d/cif.sh
-    echo "alias cif-utility='scl enable rh-python34 -- /usr/local/cifpy3/bin/cif-utility'" >> /etc/profile.d/cif.sh
+    echo "alias cif='scl enable rh-python38 -- /usr/local/cifpy3/bin/cif'" > /etc/profile.d/cif.sh
+    echo "alias cif-utility='scl enable rh-python38 -- /usr/local/cifpy3/bin/cif-utility'" >> /etc/profile.d/cif.sh
 
     # Start it up, need to detect which version
     systemctl enable cif-server.service
@@ -359,9 +361,15 @@ if [[ OS_DEBIAN -gt 0 ]] || [[ OS_UBUNTU -gt 0 ]]; then
     fi
     echo "Done"
 
+    python3 -c 'import sys; sys.exit(sys.version_info < (3, 7))'
+    if [[ $? -ne 0 ]]; then
+        echo "[ERROR] Python 3.7 or newer is required. This distribution provides $(python3 -V 2>&1)."
+        exit 1
+    fi
+
     # Pip dependencies
     echo -n "Installing Pip3 Dependencies..."
-    pip3 -q install pygeoip feedparser tabulate schedule setproctitle watchdog pika
+    pip3 -q install pygeoip maxminddb feedparser tabulate schedule setproctitle watchdog pika
     if [[ $? -ne 0 ]]; then
         echo "[ERROR] Cannot Pip Install dependencies."
         exit
@@ -14,6 +14,7 @@ MAX_BIN_SIZE = 1024 * 1024 * 10  # 10 MB
 options = None
 logging = None
 
+from . import cache
 from . import api
 from . import client
 from . import backends
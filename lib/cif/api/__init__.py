@@ -1,4 +1,8 @@
 from .handler import Handler
+from .publisher import Publisher
 from .server import Server
+from .tokencache import TokenCache
+from .writer import ResponseWriter
+from .asyncserver import AsyncServer
 
 __author__ = 'James DeVincentis <james.d@hexhost.net>'
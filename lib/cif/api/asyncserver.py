@@ -0,0 +1,207 @@
+import asyncio
+import concurrent.futures
+import io
+import re
+import threading
+
+import cif
+import cif.cache
+from .handler import Handler
+from .server import BackendMixIn
+
+__author__ = 'James DeVincentis <james.d@hexhost.net>'
+
+
+class StreamWriter(object):
+    def __init__(self, loop, writer):
+        """File like object handed to the request handler as its `wfile`. Writes are sent to the client from the event
+        loop while the handler thread waits for the transport to drain, which keeps slow clients from buffering whole
+        responses in memory.
+
+        :param asyncio.AbstractEventLoop loop: Event loop owning the connection
+        :param asyncio.StreamWriter writer: Connection to the client
+        """
+        self.loop = loop
+        self.writer = writer
+
+    async def _write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def write(self, data):
+        data = bytes(data)
+        asyncio.run_coroutine_threadsafe(self._write(data), self.loop).result()
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class AsyncHandler(Handler):
+    # Connections are kept open between requests. Responses the client can't find the end of close the connection
+    protocol_version = 'HTTP/1.1'
+    keep_alive = True
+
+    def __init__(self, request, client_address, server, wfile):
+        """Runs :py:class:`cif.api.Handler` against a request that was already read from the client by the event loop,
+        so every route behaves exactly like it does on the threaded server. `close_connection` tells the event loop
+        whether the connection can be used for another request afterwards.
+
+        :param bytes request: Complete request (request line, headers and body)
+        :param tuple client_address: Address of the client
+        :param AsyncServer server: Server the request came in on
+        :param StreamWriter wfile: Where the response is written
+        """
+        self._wfile = wfile
+        self._status = None
+        self._framed = False
+        Handler.__init__(self, request, client_address, server)
+
+    def setup(self):
+        self.connection = None
+        self.rfile = io.BytesIO(self.request)
+        self.wfile = self._wfile
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        if self._status is None:
+            self.close_connection = True
+
+    def send_response(self, code, message=None):
+        self._status = code
+        self._framed = False
+        Handler.send_response(self, code, message)
+
+    def send_header(self, keyword, value):
+        if keyword.lower() in ('content-length', 'transfer-encoding'):
+            self._framed = True
+        Handler.send_header(self, keyword, value)
+
+    def end_headers(self):
+        if not self._framed and self.command != 'HEAD' and self._status not in (204, 304):
+            Handler.send_header(self, 'Connection', 'close')
+        Handler.end_headers(self)
+
+    def finish(self):
+        pass
+
+
+class AsyncServer(BackendMixIn):
+    def __init__(self, listen_socket, name):
+        """asyncio HTTP front end for a single pre-forked API worker. Connections are accepted and read on the event
+        loop so idle or slow clients cost no thread. Complete requests are handed to :py:class:`AsyncHandler` on a
+        bounded pool of threads, which keeps the blocking backend and RabbitMQ calls off the event loop.
+
+        :param socket.socket listen_socket: Listening socket created by the API server process
+        :param int name: Number of this worker
+        """
+        self.socket = listen_socket
+        self.logging = cif.logging.getLogger('APIASYNC #{0}'.format(name))
+        self.publisher = cif.api.Publisher(cif.options.mq_host, cif.options.mq_port, cif.options.mq_work_queue_name)
+        self.backend = None
+        self.requests = 0
+        self.loop = None
+        self._backend_lock = threading.Lock()
+        self._stopped = None
+        self._connections = set()
+        # Writers of keep-alive connections waiting for their next request
+        self._idle = set()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=cif.options.api_worker_threads)
+        self.tokens = cif.api.TokenCache(self.get_backend, maxsize=cif.options.api_token_cache_size,
+                                         ttl=cif.options.api_token_cache_ttl,
+                                         refresh=cif.options.api_token_cache_refresh)
+        self.tokens.start()
+        self.results = None
+        if cif.options.api_cache_size > 0:
+            self.results = cif.cache.TTLCache(maxsize=cif.options.api_cache_size, ttl=cif.options.api_cache_ttl,
+                                              maxbytes=cif.options.api_cache_bytes)
+
+    def serve_forever(self):
+        """Serves requests until :py:meth:`stop` is called, then waits for the connections in progress to finish
+
+        """
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.set_default_executor(self.executor)
+        try:
+            self.loop.run_until_complete(self._serve())
+        finally:
+            self.loop.close()
+
+    async def _serve(self):
+        self._stopped = asyncio.Event()
+        server = await asyncio.start_server(self._handle, sock=self.socket, backlog=128)
+        self.logging.info("Serving {0} threads on {1}".format(cif.options.api_worker_threads,
+                                                               self.socket.getsockname()))
+        await self._stopped.wait()
+        server.close()
+        for writer in list(self._idle):
+            writer.close()
+        if len(self._connections):
+            await asyncio.wait(self._connections)
+
+    def stop(self):
+        """Stops accepting new connections. Safe to call from a signal handler or another thread.
+
+        """
+        if self.loop is not None and self._stopped is not None:
+            self.loop.call_soon_threadsafe(self._stopped.set)
+
+    def finish(self):
+        """Releases the request threads, backend and publisher
+
+        """
+        self.executor.shutdown(wait=True)
+        self.publisher.close()
+        if self.backend is not None:
+            self.backend.disconnect()
+
+    async def _handle(self, reader, writer):
+        # asyncio.current_task() was added in 3.7, Task.current_task() was removed in 3.9
+        task = asyncio.current_task() if hasattr(asyncio, 'current_task') else asyncio.Task.current_task()
+        self._connections.add(task)
+        try:
+            handled = 0
+            while not self._stopped.is_set():
+                # Between requests the connection is idle and closed right away when the server stops
+                if handled:
+                    self._idle.add(writer)
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), cif.options.api_async_timeout)
+                    self._idle.discard(writer)
+                    match = re.search(rb'^content-length:[ \t]*(\d+)[ \t]*\r?$', head, re.IGNORECASE | re.MULTILINE)
+                    length = int(match.group(1)) if match is not None else 0
+                    if length > cif.options.api_bulk_max_bytes:
+                        writer.write(b'HTTP/1.0 413 Request Entity Too Large\r\nConnection: close\r\n\r\n')
+                        await writer.drain()
+                        return
+                    body = await asyncio.wait_for(reader.readexactly(length), cif.options.api_async_timeout)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                    return
+                finally:
+                    self._idle.discard(writer)
+
+                try:
+                    handler = await self.loop.run_in_executor(None, AsyncHandler, head + body,
+                                                              writer.get_extra_info('peername'), self,
+                                                              StreamWriter(self.loop, writer))
+                except ConnectionError:
+                    return
+                except Exception:
+                    self.logging.exception("Exception while handling request")
+                    return
+
+                handled += 1
+                self.requests += 1
+                if 0 < cif.options.api_worker_max_requests <= self.requests and not self._stopped.is_set():
+                    self.logging.info("Handled {0} requests. Recycling.".format(self.requests))
+                    self._stopped.set()
+
+                # Chunked request bodies aren't read, so the rest of the stream can't be parsed as another request
+                if handler.close_connection or \
+                        re.search(rb'^transfer-encoding:', head, re.IGNORECASE | re.MULTILINE) is not None:
+                    return
+        finally:
+            self._connections.discard(task)
+            writer.close()
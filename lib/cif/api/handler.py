@@ -1,12 +1,14 @@
+import base64
 import cgi
 import datetime
+import hashlib
+import hmac
 import http.server
+import itertools
 import json
 import re
-import setproctitle
 import urllib.parse
-
-import pika
+import zlib
 
 import cif
 
@@ -14,26 +16,17 @@ __author__ = 'James DeVincentis <james.d@hexhost.net>'
 
 
 class Handler(http.server.BaseHTTPRequestHandler):
+    # Whether the server reuses connections for more requests once a streamed response is complete
+    keep_alive = False
+
     def __init__(self, *args):
         self.backend = None
         self.token = None
         http.server.BaseHTTPRequestHandler.__init__(self, *args)
 
     def connect_to_backend(self):
-        try:
-            setproctitle.setproctitle('CIF-SERVER (API Handle, {0} {1})'.format(self.command, self.path))
-        except:
-            pass
-        # Based on the startup options for cif-server, let's get the backend + instantiate the class from that module
-        self.server.logging.debug("Loading backend: {0}".format(cif.options.storage.lower()))
-        self.backend = getattr(__import__("cif.backends.{0}".format(
-            cif.options.storage.lower()), fromlist=[cif.options.storage.title()]), cif.options.storage.title()
-        )()
-
-        # Connect to the backend
-        self.server.logging.debug("Connecting to backend: {0}".format(cif.options.storage_uri))
-        self.backend.connect(cif.options.storage_uri)
-        self.server.logging.info("Connected to backend: {0}".format(cif.options.storage_uri))
+        # The api worker keeps one backend connection for all of its requests
+        self.backend = self.server.get_backend()
 
     def check_authentication(self):
         """Checks authentication for an incoming request
@@ -66,7 +59,7 @@ class Handler(http.server.BaseHTTPRequestHandler):
                                                                                   self.client_address[1]
                                                                                   ))
             try:
-                self.token = self.backend.token_get(self.headers['Authorization'])
+                self.token = self.server.tokens.get(self.headers['Authorization'])
             except LookupError as e:
                 self.server.logging.warning("Unauthorized token '{0}' attempting to be used by {1}:{2}".format(
                     self.headers['Authorization'],
@@ -78,6 +71,7 @@ class Handler(http.server.BaseHTTPRequestHandler):
             except RuntimeError as e:
                 self.send_error(500, 'Internal Server Error', str(e))
                 self.server.logging.exception('Exception while handling authorization')
+                return False
 
         if self.token.revoked:
             self.send_error(401, 'Not Authorized', 'Token has been revoked')
@@ -124,6 +118,194 @@ class Handler(http.server.BaseHTTPRequestHandler):
         # User has passed checks and are an admin, return True
         return True
 
+    def start_stream(self, content_type, headers=None):
+        """Sends the headers of a 200 response whose length isn't known up front. HTTP/1.1 clients get the body in
+        chunked transfer encoding, HTTP/1.0 clients get it until the connection is closed. The body is compressed
+        when the client accepts gzip or zstd.
+
+        :param str content_type: Content type of the response
+        :param dict headers: Additional headers to send
+        :return: Writer for the response body
+        :rtype: cif.api.ResponseWriter
+        """
+        chunked = self.request_version == 'HTTP/1.1'
+        encoding = self.negotiate_encoding()
+        if chunked:
+            self.protocol_version = 'HTTP/1.1'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        if not self.keep_alive:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        return cif.api.ResponseWriter(self.wfile, chunked=chunked, encoding=encoding,
+                                      level=cif.options.api_compression_level)
+
+    @staticmethod
+    def parse_fields(args):
+        """Removes the fields parameter from search parameters and returns the field names it selects. Fields can be
+        given as a comma separated list, as repeated parameters or both.
+
+        :param dict args: Search parameters
+        :return: List of field names or None when all fields were requested
+        :rtype: list[str] or None
+        :raises: ValueError
+        """
+        if "fields" not in args:
+            return None
+        value = args["fields"]
+        del args["fields"]
+        if not isinstance(value, list):
+            value = [value]
+        fields = []
+        for field in ",".join(value).split(","):
+            field = field.strip()
+            if not len(field):
+                continue
+            if re.match(r'^[a-zA-Z0-9_]+$', field) is None:
+                raise ValueError("Invalid field name: '{0}'".format(field))
+            if field not in fields:
+                fields.append(field)
+        return fields or None
+
+    def restrict_groups(self, args):
+        """Limits the groups searched to the groups of the authenticated token. Searches all of the token's groups if
+        none of the requested groups are allowed or none were requested.
+
+        :param dict args: Search parameters
+        """
+        if "noauth" in cif.options and cif.options.noauth:
+            return
+        if "group" in args:
+            if not isinstance(args["group"], list):
+                args["group"] = [args["group"]]
+            args["group"] = [group for group in args["group"] if group in self.token.groups]
+            if len(args["group"]) == 0:
+                args["group"] = self.token.groups
+        else:
+            args["group"] = self.token.groups
+
+    @staticmethod
+    def normalize_args(args):
+        """Returns search parameters in a canonical form: every value is a sorted list. Parameters that only differ in
+        order or in single values versus lists normalize to the same thing.
+
+        :param dict args: Search parameters
+        :return: Normalized search parameters
+        :rtype: dict
+        """
+        return dict((k, sorted(v) if isinstance(v, list) else [v]) for k, v in args.items())
+
+    @classmethod
+    def _query_digest(cls, args):
+        return hashlib.sha256(json.dumps(cls.normalize_args(args), sort_keys=True).encode('UTF-8')).hexdigest()
+
+    def cache_key(self, kind, args, **options):
+        """Returns the key of a search in the result cache. The groups the token may search are part of the search
+        parameters, so tokens with different groups never share results.
+
+        :param str kind: Type of result (search, count)
+        :param dict args: Search parameters
+        :param options: Other options changing the result, like start and count
+        :return: Cache key, or None if result caching is disabled
+        :rtype: str or None
+        """
+        if self.server.results is None:
+            return None
+        return json.dumps([kind, self.normalize_args(args), options], sort_keys=True)
+
+    def negotiate_encoding(self):
+        """Picks the content encoding for the response from the client's Accept-Encoding header
+
+        :return: gzip or zstd, or None when the response isn't compressed
+        :rtype: None or str
+        """
+        if cif.options.api_compression_level <= 0:
+            return None
+        return cif.api.ResponseWriter.negotiate(self.headers.get('Accept-Encoding'))
+
+    def send_body(self, content_type, body, etag, headers=None, encoding=None):
+        """Sends a complete 200 response, or 304 when the client already has the body with this ETag
+
+        :param str content_type: Content type of the response
+        :param bytes body: Response body, already compressed with `encoding`
+        :param str etag: Quoted entity tag of the body
+        :param dict headers: Additional headers to send
+        :param encoding: Content encoding of the body. None if it isn't compressed
+        :type encoding: None or str
+        """
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None and (if_none_match.strip() == '*' or
+                                          etag in [tag.strip() for tag in if_none_match.split(',')]):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('ETag', etag)
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', len(body))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def encode_cursor(self, args, cursor):
+        """Wraps a backend cursor into the opaque token sent to the client in the X-CIF-Cursor header. The token is
+        bound to the search parameters (including the groups of the token used) and signed with the server's cursor
+        key, so it can't be used for another search or altered by the client.
+
+        :param dict args: Search parameters, without start, count and cursor
+        :param cursor: Cursor returned by the backend
+        :return: Opaque cursor token
+        :rtype: str
+        """
+        data = json.dumps({"cursor": cursor, "query": self._query_digest(args)}).encode('UTF-8')
+        data = base64.urlsafe_b64encode(data)
+        return "{0}.{1}".format(data.decode('ascii'), self._cursor_signature(data))
+
+    @staticmethod
+    def _cursor_signature(data):
+        return hmac.new(cif.options.api_cursor_key.encode('UTF-8'), data, hashlib.sha256).hexdigest()
+
+    def decode_cursor(self, args, token):
+        """Unwraps a cursor token sent by the client. The value "start" begins a new cursor search.
+
+        :param args: Search parameters, without start, count and cursor. The search isn't checked if None
+        :type args: dict or None
+        :param str token: Cursor token from the query string
+        :return: Backend cursor, or True to start a new cursor search
+        :raises: ValueError
+        """
+        if token == "start":
+            return True
+        try:
+            (data, signature) = token.split('.')
+            data = data.encode('ascii')
+        except Exception as e:
+            raise ValueError("Cursor is not valid") from e
+        if not hmac.compare_digest(signature, self._cursor_signature(data)):
+            raise ValueError("Cursor is not valid")
+        try:
+            data = json.loads(base64.urlsafe_b64decode(data).decode('UTF-8'))
+            cursor = data["cursor"]
+            query = data["query"]
+        except Exception as e:
+            raise ValueError("Cursor is not valid") from e
+        if args is not None and query != self._query_digest(args):
+            raise ValueError("Cursor does not belong to this query")
+        return cursor
+
     def send_bad_request(self, error=""):
         """Sends a bad request error to the client
         :param error: String containing error message
@@ -163,24 +345,26 @@ class Handler(http.server.BaseHTTPRequestHandler):
                 (k, v if len(v) > 1 else v[0]) for k, v in urllib.parse.parse_qs(request['query_string']).items()
             )
 
-            if "noauth" not in cif.options or not cif.options.noauth:
-                if "group" in args:
-                    if not isinstance(args["group"], list):
-                        args["group"] = [args["group"]]
-                    for idx, group in enumerate(args["group"]):
-                        if group not in self.token.groups:
-                            del group[idx]
-                    if len(args["group"]) == 0:
-                        args["group"] = self.token.groups
-                else:
-                    args["group"] = self.token.groups
+            self.restrict_groups(args)
+
+            # Field selection doesn't change the count
+            if "fields" in args:
+                del args["fields"]
+
+            cache_key = self.cache_key("count", args)
+            count = None
+            if cache_key is not None:
+                count = self.server.results.get(cache_key)
 
             try:
-                self.server.logging.debug("Searching backend for query for {0}:{1}".format(
-                    self.client_address[0],
-                    self.client_address[1]
-                ))
-                count = self.backend.observable_search(args, count_only=True)
+                if count is None:
+                    self.server.logging.debug("Searching backend for query for {0}:{1}".format(
+                        self.client_address[0],
+                        self.client_address[1]
+                    ))
+                    count = self.backend.observable_search(args, count_only=True)
+                    if cache_key is not None:
+                        self.server.results.set(cache_key, count, size=len(cache_key))
                 self.send_response(200)
                 self.send_header('Content-Type', 'application/json')
                 self.send_header('Content-Length', count)
@@ -224,17 +408,7 @@ class Handler(http.server.BaseHTTPRequestHandler):
                 (k, v if len(v) > 1 else v[0]) for k, v in urllib.parse.parse_qs(request['query_string']).items()
             )
 
-            if "noauth" not in cif.options or not cif.options.noauth:
-                if "group" in args:
-                    if not isinstance(args["group"], list):
-                        args["group"] = [args["group"]]
-                    for idx, group in enumerate(args["group"]):
-                        if group not in self.token.groups:
-                            del group[idx]
-                    if len(args["group"]) == 0:
-                        args["group"] = self.token.groups
-                else:
-                    args["group"] = self.token.groups
+            self.restrict_groups(args)
 
             start = 0
             count = cif.options.handler_max_count
@@ -253,28 +427,108 @@ class Handler(http.server.BaseHTTPRequestHandler):
                     count = int(args["count"])
                 del args['count']
 
+            try:
+                fields = self.parse_fields(args)
+            except ValueError as e:
+                self.send_error(400, 'Bad Request', str(e))
+                return
+
+            cursor = None
+            if "cursor" in args:
+                cursor = args["cursor"][-1] if isinstance(args["cursor"], list) else args["cursor"]
+                del args['cursor']
+                try:
+                    cursor = self.decode_cursor(args, cursor)
+                except ValueError as e:
+                    self.send_error(400, 'Bad Request', str(e))
+                    return
+            next_cursor = None
+
+            # Only complete results are cached. Continuing a cursor always goes to the backend. Results are cached
+            # compressed with the encoding the client accepts so a cache hit is sent as it is
+            encoding = self.negotiate_encoding()
+            cache_key = None
+            if cursor is None or cursor is True:
+                cache_key = self.cache_key("search", args, start=start, count=count, fields=fields,
+                                           cursor=cursor is True, encoding=encoding)
+                if cache_key is not None:
+                    cached = self.server.results.get(cache_key)
+                    if cached is not None:
+                        self.send_body('application/json', *cached)
+                        return
+            query = self.normalize_args(args)
+
             try:
                 self.server.logging.debug("Searching backend for query for {0}:{1}".format(
                     self.client_address[0],
                     self.client_address[1]
                 ))
-                observables = self.backend.observable_search(args, start, count)
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(bytes('[', 'ISO8859-1'))
-                for observable in observables[:-1]:
-                    self.wfile.write(bytes(json.dumps(observable.todict()) + ", ", 'ISO8859-1'))
+                if cursor is not None:
+                    (observables, next_cursor) = self.backend.observable_scroll(
+                        args, count, None if cursor is True else cursor, raw=True, fields=fields
+                    )
                 else:
-                    self.wfile.write(bytes(json.dumps(observables[-1].todict()), 'ISO8859-1'))
-                self.wfile.write(bytes(']', 'ISO8859-1'))
-            except LookupError as e:
+                    observables = self.backend.observable_search_iter(args, start, count,
+                                                                      page_size=cif.options.api_search_page_size,
+                                                                      raw=True, fields=fields)
+                # Fetch the first result before sending headers so an empty or failed search can still be reported
+                observable = next(observables)
+            except (LookupError, StopIteration) as e:
                 self.server.logging.exception("404 Not Found")
                 self.send_error(404, 'Not Found', str(e))
+                return
             except Exception as e:
                 self.server.logging.exception("500 Internal Server Error")
                 self.send_error(500, 'Internal Server Error', str(e))
                 self.server.logging.exception('Exception while GET')
+                return
+
+            headers = {}
+            if next_cursor is not None:
+                headers['X-CIF-Cursor'] = self.encode_cursor(query, next_cursor)
+                cache_key = None
+
+            # Small enough results are collected so they can be cached and sent with an ETag. Anything larger, or
+            # anything that can't be cached, is streamed as it comes in
+            buffered = []
+            buffered_size = 0
+            writer = None
+            try:
+                # Stored documents are passed through as they are, building observable objects is far too slow
+                parts = itertools.chain([bytes('[' + json.dumps(observable), 'ISO8859-1')],
+                                        (bytes(", " + json.dumps(item), 'ISO8859-1') for item in observables),
+                                        [bytes(']', 'ISO8859-1')])
+                for part in parts:
+                    if writer is not None:
+                        writer.write(part)
+                        continue
+                    buffered.append(part)
+                    buffered_size += len(part)
+                    if cache_key is None or buffered_size > cif.options.api_cache_max_bytes:
+                        writer = self.start_stream('application/json', headers)
+                        for data in buffered:
+                            writer.write(data)
+                        buffered = None
+                if writer is not None:
+                    writer.close()
+            except Exception as e:
+                if writer is None:
+                    self.server.logging.exception("500 Internal Server Error")
+                    self.send_error(500, 'Internal Server Error', str(e))
+                    return
+                # Headers are gone already. Dropping the connection without ending the body tells the client it failed
+                self.server.logging.exception('Exception while streaming observables')
+                self.close_connection = True
+                return
+
+            if writer is None:
+                body = b''.join(buffered)
+                # Every encoding of the body is a different representation and gets its own entity tag
+                etag = '"{0}{1}"'.format(hashlib.sha1(body).hexdigest(), '' if encoding is None else '-' + encoding)
+                if encoding is not None:
+                    body = cif.api.ResponseWriter.compress(body, encoding, cif.options.api_compression_level)
+                self.server.results.set(cache_key, (body, etag, headers, encoding), size=len(body) + len(cache_key))
+                self.send_body('application/json', body, etag, headers, encoding)
 
         elif request['object'] == "tokens":
             if not self.is_admin():
@@ -336,6 +590,8 @@ class Handler(http.server.BaseHTTPRequestHandler):
         except Exception as e:
             self.send_error(500, 'Internal Server Error', str(e))
             return
+        finally:
+            self.server.tokens.invalidate(request['id'])
 
     def do_PUT(self):
         """Processes PUT request. PUT requests will create a new object.
@@ -344,15 +600,19 @@ class Handler(http.server.BaseHTTPRequestHandler):
 
         """
         self.connect_to_backend()
-        if not self.check_authentication:
+        if not self.check_authentication():
             return
 
-        match = re.search(r'^/(?P<object>observable?|token?)/?$', self.path)
+        match = re.search(r'^/(?P<object>observables|observable?|token?)/?$', self.path)
 
         if match is None:
             self.send_bad_request()
             return
 
+        if match.group('object') == "observables":
+            self.put_observables()
+            return
+
         # Update the ID with the given post parameters
         content_type, parameter_dict = cgi.parse_header(self.headers['Content-Type'])
         if content_type == 'multipart/form-data':
@@ -395,31 +655,155 @@ class Handler(http.server.BaseHTTPRequestHandler):
             except Exception as e:
                 self.send_error(422, 'Could not process observable: {0}'.format(e))
                 return
-            # Send the observable to the backend
-            connection = pika.BlockingConnection(pika.ConnectionParameters(
-                host=cif.options.mq_host,
-                port=cif.options.mq_port
-            ))
-            channel = connection.channel()
-            channel.queue_declare(queue=cif.options.mq_work_queue_name, durable=True)
-            channel.basic_publish(
-                exchange='',
-                routing_key=cif.options.mq_work_queue_name,
-                body=json.dumps(observable.todict()),
-                properties=pika.BasicProperties(delivery_mode=2)
-            )
-            connection.close()
+            # Send the observable to the workers
+            try:
+                confirmed = self.server.publisher.publish([json.dumps(observable.todict())])[0]
+            except RuntimeError:
+                self.server.logging.exception('Exception while publishing observable')
+                confirmed = False
+            if not confirmed:
+                self.send_error(503, 'Service Unavailable', 'Could not queue observable')
+                return
 
             self.send_response(202)
             self.send_header('Location', '/observable/{0}'.format(observable.id))
             self.end_headers()
             self.wfile.write(bytes(json.dumps(observable.todict()), 'ISO8859-1'))
 
+    def put_observables(self):
+        """Processes a bulk observable submission. The body is either a JSON array of observables or newline delimited
+        JSON (one observable per line) and may be gzip encoded. Every item is validated on its own and valid ones are
+        sent to the work queue in batches. Sends a 202 (Accepted) with a JSON list holding a result for each item.
+
+        """
+        try:
+            length = int(self.headers['Content-Length'])
+        except (TypeError, ValueError):
+            self.send_error(411, 'Length Required')
+            self.close_connection = True
+            return
+        # Refuse oversized bodies before reading them. The body is left unread so the connection can't be reused
+        if length > cif.options.api_bulk_max_bytes:
+            self.send_error(413, 'Request Entity Too Large')
+            self.close_connection = True
+            return
+
+        try:
+            body = self.rfile.read(length)
+            if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                body = decompressor.decompress(body, cif.options.api_bulk_max_bytes)
+                if decompressor.unconsumed_tail:
+                    self.send_error(413, 'Request Entity Too Large')
+                    return
+                if not decompressor.eof:
+                    self.send_error(400, 'Bad Request', 'Request body is a truncated gzip stream')
+                    return
+            body = body.decode('UTF-8')
+        except Exception as e:
+            self.send_error(400, 'Bad Request', 'Could not read request body: {0}'.format(e))
+            return
+
+        content_type = cgi.parse_header(self.headers.get('Content-Type', 'application/json'))[0]
+        if content_type == 'application/json' and body.lstrip().startswith('['):
+            try:
+                items = json.loads(body)
+            except Exception as e:
+                self.send_error(400, 'Bad Request', 'Could not decode JSON array: {0}'.format(e))
+                return
+        else:
+            items = []
+            for line in body.splitlines():
+                if len(line.strip()) == 0:
+                    continue
+                try:
+                    items.append(json.loads(line))
+                except Exception as e:
+                    items.append(e)
+
+        results = []
+        messages = []
+        for index, item in enumerate(items):
+            if isinstance(item, Exception):
+                results.append({"index": index, "status": 422, "error": 'Could not decode JSON: {0}'.format(item)})
+                continue
+            if not isinstance(item, dict) or "observable" not in item:
+                results.append({"index": index, "status": 422, "error": 'The observable parameter is required'})
+                continue
+            try:
+                if "id" in item:
+                    del item["id"]
+                observable = cif.types.Observable(item)
+            except Exception as e:
+                results.append({"index": index, "status": 422, "error": 'Could not process observable: {0}'.format(e)})
+                continue
+            messages.append(json.dumps(observable.todict()))
+            results.append({"index": index, "status": 202, "id": observable.id})
+
+        self.server.logging.debug("Bulk submission of {0} items with {1} valid observables from {2}:{3}".format(
+            len(items), len(messages), self.client_address[0], self.client_address[1]
+        ))
+
+        # Results of the items that were queued, in the same order as messages
+        queued = [result for result in results if result["status"] == 202]
+        for start in range(0, len(messages), cif.options.api_bulk_batch_size):
+            try:
+                confirmed = self.server.publisher.publish(messages[start:start + cif.options.api_bulk_batch_size])
+            except RuntimeError as e:
+                self.server.logging.exception('Exception while publishing bulk observables')
+                confirmed = [False] * len(messages[start:start + cif.options.api_bulk_batch_size])
+            for offset, ok in enumerate(confirmed):
+                if not ok:
+                    result = queued[start + offset]
+                    del result["id"]
+                    result["status"] = 503
+                    result["error"] = 'Could not queue observable'
+
+        self.send_response(202)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(bytes(json.dumps(results), 'ISO8859-1'))
+
+    def delete_cursor(self, query_string):
+        """Releases the backend resources of a cursor search a client stops before reaching its end. Sends a 204 (No
+        Content) once the cursor is cleared.
+
+        :param str query_string: Query string holding the cursor
+        """
+        token = urllib.parse.parse_qs(query_string).get('cursor', [None])[-1]
+        try:
+            if token is None:
+                raise ValueError("A cursor is required")
+            cursor = self.decode_cursor(None, token)
+            if cursor is True:
+                raise ValueError("A cursor is required")
+        except ValueError as e:
+            self.send_error(400, 'Bad Request', str(e))
+            return
+
+        try:
+            self.backend.observable_scroll_clear(cursor)
+        except Exception as e:
+            self.server.logging.exception("500 Internal Server Error")
+            self.send_error(500, 'Internal Server Error', str(e))
+            return
+
+        self.send_response(204)
+        self.end_headers()
+
     def do_DELETE(self):
         """Handles a DELETE HTTP request. Only tokens can be deleted at this time.
         :return:
         """
         self.connect_to_backend()
+        if not self.check_authentication():
+            return
+
+        match = re.search(r'^/observables\?(?P<query_string>.+)$', self.path)
+        if match is not None:
+            self.delete_cursor(match.group('query_string'))
+            return
+
         if not self.is_admin():
             return
 
@@ -435,3 +819,5 @@ class Handler(http.server.BaseHTTPRequestHandler):
             self.backend.token_delete(request['id'])
         except Exception as e:
             self.send_error(500, "Failed to delete token: {0}".format(e))
+        finally:
+            self.server.tokens.invalidate(request['id'])
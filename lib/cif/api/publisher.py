@@ -0,0 +1,89 @@
+import os
+import threading
+
+import pika
+
+import cif
+
+__author__ = 'James DeVincentis <james.d@hexhost.net>'
+
+
+class Publisher(object):
+    def __init__(self, host, port, queue):
+        """Long lived, thread safe publisher for the work queue. The connection is opened on first use, kept open for
+        later publishes and reopened if it fails. Publisher confirms are enabled so every message is known to have
+        reached the broker.
+
+        :param str host: RabbitMQ host
+        :param int port: RabbitMQ port
+        :param str queue: Name of the work queue to publish to
+        """
+        self.host = host
+        self.port = port
+        self.queue = queue
+        self.logging = cif.logging.getLogger('PUBLISHER')
+        self._connection = None
+        self._channel = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self._close()
+        self.logging.debug("Connecting to RabbitMQ at {0}:{1}".format(self.host, self.port))
+        self._connection = pika.BlockingConnection(pika.ConnectionParameters(host=self.host, port=self.port))
+        self._channel = self._connection.channel()
+        self._channel.queue_declare(queue=self.queue, durable=True)
+        self._channel.confirm_delivery()
+        # Connections can't be shared with forked children, they need their own
+        self._pid = os.getpid()
+
+    def _close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+        self._connection = None
+        self._channel = None
+
+    def publish(self, messages):
+        """Publishes a batch of messages to the work queue as persistent messages. If the connection fails part way
+        through it is reopened once and publishing resumes with the failed message.
+
+        :param list[str] messages: Message bodies to publish
+        :return: List of booleans, True for every message the broker confirmed
+        :rtype: list[bool]
+        :raises: RuntimeError
+        """
+        results = []
+        with self._lock:
+            for attempt in range(0, 2):
+                try:
+                    if self._channel is None or self._pid != os.getpid() or not self._connection.is_open:
+                        self._connect()
+                    for message in messages[len(results):]:
+                        try:
+                            confirmed = self._channel.basic_publish(
+                                exchange='',
+                                routing_key=self.queue,
+                                body=message,
+                                properties=pika.BasicProperties(delivery_mode=2)
+                            )
+                        except (pika.exceptions.UnroutableError, pika.exceptions.NackError):
+                            confirmed = False
+                        # Older pika returns False for nacked messages, newer raises instead and returns None
+                        results.append(confirmed is not False)
+                    return results
+                except Exception as e:
+                    self.logging.warning("Publishing failed, reconnecting: {0}".format(e))
+                    self._close()
+                    if attempt:
+                        raise RuntimeError("Could not publish to the work queue") from e
+        return results
+
+    def close(self):
+        """Closes the connection to the broker
+
+        """
+        with self._lock:
+            self._close()
@@ -1,19 +1,122 @@
+import concurrent.futures
 import http.server
 import multiprocessing
+import os
 import setproctitle
-import socketserver
+import signal
+import socket
 import sys
+import threading
+import time
 
 import cif
+import cif.cache
 
 __author__ = 'James DeVincentis <james.d@hexhost.net>'
 
 
-class HTTPServer(socketserver.ForkingMixIn, http.server.HTTPServer):
-    def __init__(self, *args, **kwargs):
-        http.server.HTTPServer.__init__(self, *args, **kwargs)
+class BackendMixIn(object):
+    """Shares one backend connection between all request threads of an api worker. Expects `logging`, `backend` and
+    `_backend_lock` attributes on the server.
 
-        self.logging = cif.logging.getLogger('APIHTTP')
+    """
+    def get_backend(self):
+        """Returns the backend shared by all request threads of this worker, connecting to it on first use
+
+        :return: Connected backend
+        :rtype: cif.backends.Backend
+        """
+        with self._backend_lock:
+            if self.backend is None:
+                self.logging.debug("Loading backend: {0}".format(cif.options.storage.lower()))
+                backend = getattr(__import__("cif.backends.{0}".format(
+                    cif.options.storage.lower()), fromlist=[cif.options.storage.title()]), cif.options.storage.title()
+                )()
+                self.logging.debug("Connecting to backend: {0}".format(cif.options.storage_uri))
+                backend.connect(cif.options.storage_uri, timeout=cif.options.storage_timeout)
+                self.logging.info("Connected to backend: {0}".format(cif.options.storage_uri))
+                self.backend = backend
+        return self.backend
+
+
+class HTTPServer(BackendMixIn, http.server.HTTPServer):
+    def __init__(self, listen_socket, name):
+        """HTTP server for a single pre-forked API worker. Requests are accepted from the listening socket shared by all
+        workers and handled on a bounded pool of threads. The backend connection and the publisher are kept for the
+        life of the worker.
+
+        :param socket.socket listen_socket: Listening socket created by the API server process
+        :param int name: Number of this worker
+        """
+        (host, port) = listen_socket.getsockname()[:2]
+        http.server.HTTPServer.__init__(self, (host, port), cif.api.Handler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = listen_socket
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+
+        self.logging = cif.logging.getLogger('APIHTTP #{0}'.format(name))
+        self.publisher = cif.api.Publisher(cif.options.mq_host, cif.options.mq_port, cif.options.mq_work_queue_name)
+        self.backend = None
+        self.requests = 0
+        self._backend_lock = threading.Lock()
+        self._requests_lock = threading.Lock()
+        # Acquired once by the first call to stop() and never released
+        self._stop_lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=cif.options.api_worker_threads)
+        self.tokens = cif.api.TokenCache(self.get_backend, maxsize=cif.options.api_token_cache_size,
+                                         ttl=cif.options.api_token_cache_ttl,
+                                         refresh=cif.options.api_token_cache_refresh)
+        self.tokens.start()
+        self.results = None
+        if cif.options.api_cache_size > 0:
+            self.results = cif.cache.TTLCache(maxsize=cif.options.api_cache_size, ttl=cif.options.api_cache_ttl,
+                                              maxbytes=cif.options.api_cache_bytes)
+
+    def get_request(self):
+        # The listening socket is non-blocking so workers that lose the race for a connection don't block
+        (conn, address) = self.socket.accept()
+        conn.setblocking(True)
+        return conn, address
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+        with self._requests_lock:
+            self.requests += 1
+            recycle = 0 < cif.options.api_worker_max_requests <= self.requests
+        if recycle:
+            self.logging.info("Handled {0} requests. Recycling.".format(self.requests))
+            self.stop()
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def stop(self):
+        """Stops accepting new requests. serve_forever() returns once the current loop finishes. Safe to call from a
+        signal handler or a request thread as it never waits on a lock, so a signal arriving while the main thread holds
+        one cannot deadlock.
+
+        """
+        if not self._stop_lock.acquire(blocking=False):
+            return
+        thread = threading.Thread(target=self.shutdown)
+        thread.daemon = True
+        thread.start()
+
+    def finish(self):
+        """Waits for requests in progress to complete and releases the backend and publisher
+
+        """
+        self.executor.shutdown(wait=True)
+        self.publisher.close()
+        if self.backend is not None:
+            self.backend.disconnect()
 
 
 class Server(multiprocessing.Process):
@@ -21,6 +124,10 @@ class Server(multiprocessing.Process):
         multiprocessing.Process.__init__(self)
         self.logging = cif.logging.getLogger('api')
         self.logging.debug("Initialized api Server")
+        self.socket = None
+        self.children = {}
+        self._stopping = False
+        self._reload = False
 
     def run(self):
         try:
@@ -28,7 +135,99 @@ class Server(multiprocessing.Process):
         except:
             pass
         self.logging.info("Starting api Server")
-        # Run the api server
-        server = HTTPServer((cif.options.host, cif.options.port), cif.api.Handler)
-        server.serve_forever()
+
+        # Bind once here. Every worker accepts from this socket so restarting workers never refuses connections
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((cif.options.host, cif.options.port))
+        self.socket.listen(128)
+        self.socket.setblocking(False)
+
+        signal.signal(signal.SIGTERM, self._signal_stop)
+        signal.signal(signal.SIGHUP, self._signal_reload)
+
+        while not self._stopping:
+            self._reap()
+
+            if self._reload:
+                self._reload = False
+                self.logging.warning("Gracefully restarting {0} api workers".format(len(self.children)))
+                for pid in self.children.values():
+                    os.kill(pid, signal.SIGTERM)
+
+            for number in range(1, cif.options.api_workers + 1):
+                if number not in self.children:
+                    self._spawn(number)
+
+            time.sleep(1)
+
+        self.logging.info("Stopping {0} api workers".format(len(self.children)))
+        for pid in self.children.values():
+            os.kill(pid, signal.SIGTERM)
+        while len(self.children):
+            time.sleep(0.1)
+            self._reap()
         sys.exit()
+
+    def _signal_stop(self, signum, frame):
+        self._stopping = True
+
+    def _signal_reload(self, signum, frame):
+        self._reload = True
+
+    def _reap(self):
+        """Collects exited api workers so they are replaced on the next loop
+
+        """
+        while True:
+            try:
+                (pid, status) = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            for number, child in list(self.children.items()):
+                if child == pid:
+                    self.logging.info("api worker #{0} exited with status {1}".format(number, status))
+                    del self.children[number]
+
+    def _spawn(self, number):
+        """Forks a new api worker. Forking directly is used as the api server itself runs as a daemonic process
+
+        :param int number: Number of the worker
+        """
+        pid = os.fork()
+        if pid:
+            self.children[number] = pid
+            return
+
+        status = 0
+        try:
+            self._work(number)
+        except Exception:
+            self.logging.exception("api worker #{0} failed".format(number))
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _work(self, number):
+        """Body of a forked api worker. Serves requests until it is told to stop or has handled
+        --api-worker-max-requests requests, then finishes the requests in progress.
+
+        :param int number: Number of the worker
+        """
+        try:
+            setproctitle.setproctitle('CIF-SERVER (API Worker #{0})'.format(number))
+        except:
+            pass
+
+        if cif.options.api_server == "asyncio":
+            server = cif.api.AsyncServer(self.socket, number)
+        else:
+            server = HTTPServer(self.socket, number)
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        # Shutdown is driven by the api server process
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        server.serve_forever()
+        server.finish()
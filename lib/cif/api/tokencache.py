@@ -0,0 +1,87 @@
+import threading
+import time
+
+import cif
+import cif.cache
+
+__author__ = 'James DeVincentis <james.d@hexhost.net>'
+
+
+class TokenCache(object):
+    def __init__(self, get_backend, maxsize=10000, ttl=300, refresh=60):
+        """Caches tokens used for authentication so requests don't need a backend lookup first. A token is cached for
+        `ttl` seconds after it was looked up, whether it is used in the meantime or not. Cached tokens are fetched
+        again in the background every `refresh` seconds so revocations, expirations and deletions made through other
+        api workers are picked up before the entry expires. Changes made through this worker take effect right away,
+        other workers see them within `refresh` seconds (or `ttl` seconds when refreshing is disabled).
+
+        :param get_backend: Callable returning a connected backend
+        :param int maxsize: Maximum number of cached tokens
+        :param int ttl: Seconds a token stays cached after it was looked up
+        :param int refresh: Seconds between background refreshes. 0 disables refreshing
+        """
+        self.get_backend = get_backend
+        self.refresh_interval = refresh
+        self.cache = cif.cache.TTLCache(maxsize=maxsize, ttl=ttl)
+        self.logging = cif.logging.getLogger('TOKENCACHE')
+        self._thread = None
+
+    def get(self, token_id):
+        """Returns a token from the cache, looking it up in the backend when it isn't cached
+
+        :param str token_id: A 64 character token ID
+        :return: A token object
+        :rtype: cif.types.Token
+        :raises: RuntimeError
+        :raises: LookupError
+        """
+        token = self.cache.get(token_id)
+        if token is None:
+            token = self.get_backend().token_get(token_id)
+            self.cache.set(token_id, token)
+        return token
+
+    def invalidate(self, token_id):
+        """Drops a token from the cache. Used after a token is updated or deleted. Only affects this worker.
+
+        :param str token_id: A 64 character token ID
+        """
+        self.cache.delete(token_id)
+
+    def refresh(self):
+        """Fetches every unexpired cached token from the backend again. Refreshed tokens keep the expiry they were
+        cached with so unused tokens still drop out after `ttl`. Tokens that no longer exist are dropped, tokens that
+        can't be fetched are left to expire.
+
+        """
+        token_ids = self.cache.keys()
+        if not len(token_ids):
+            return
+        try:
+            tokens = self.get_backend().token_get_many(token_ids)
+        except Exception as e:
+            self.logging.warning("Could not refresh {0} tokens: {1}".format(len(token_ids), e))
+            return
+        for token_id in token_ids:
+            if token_id in tokens:
+                self.cache.update(token_id, tokens[token_id])
+            else:
+                self.cache.delete(token_id)
+
+    def start(self):
+        """Starts refreshing cached tokens in the background
+
+        """
+        if self.refresh_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="TokenCache")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception:
+                self.logging.exception("Token refresh failed")
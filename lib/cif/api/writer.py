@@ -0,0 +1,116 @@
+import re
+import zlib
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+__author__ = 'James DeVincentis <james.d@hexhost.net>'
+
+
+class ResponseWriter(object):
+    def __init__(self, wfile, chunked=False, buffer_size=65536, encoding=None, level=6):
+        """Buffers a streamed response body and writes it to the client in large pieces, optionally compressed and
+        framed with chunked transfer encoding
+
+        :param wfile: File like object connected to the client
+        :param bool chunked: Frame every write as an HTTP/1.1 chunk
+        :param int buffer_size: Number of bytes collected before they are written
+        :param encoding: Content encoding to compress the body with (gzip or zstd). Not compressed if None
+        :type encoding: None or str
+        :param int level: Compression level
+        """
+        self.wfile = wfile
+        self.chunked = chunked
+        self.buffer_size = buffer_size
+        self.encoding = encoding
+        self._buffer = []
+        self._size = 0
+
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        elif encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self._compressor = None
+
+    @staticmethod
+    def negotiate(accept_encoding):
+        """Picks the content encoding to use for a response from the client's Accept-Encoding header
+
+        :param accept_encoding: Value of the Accept-Encoding header
+        :type accept_encoding: None or str
+        :return: zstd or gzip, or None if the client accepts neither
+        :rtype: None or str
+        """
+        if not accept_encoding:
+            return None
+        accepted = {}
+        for part in accept_encoding.split(','):
+            (name, separator, parameters) = part.partition(';')
+            match = re.search(r'q\s*=\s*([0-9.]+)', parameters)
+            try:
+                accepted[name.strip().lower()] = float(match.group(1)) if match is not None else 1.0
+            except ValueError:
+                continue
+        for encoding in (['zstd', 'gzip'] if HAS_ZSTD else ['gzip']):
+            if accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding
+        return None
+
+    @staticmethod
+    def compress(data, encoding, level=6):
+        """Compresses a complete response body
+
+        :param bytes data: Response body
+        :param str encoding: Content encoding to compress with (gzip or zstd)
+        :param int level: Compression level
+        :return: Compressed body
+        :rtype: bytes
+        """
+        if encoding == "zstd":
+            return zstandard.ZstdCompressor(level=level).compress(data)
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    def write(self, data):
+        """Adds data to the response
+
+        :param bytes data: Data to send
+        """
+        self._buffer.append(data)
+        self._size += len(data)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Writes all buffered data to the client
+
+        """
+        if not self._size:
+            return
+        data = b''.join(self._buffer)
+        self._buffer = []
+        self._size = 0
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._write(data)
+
+    def _write(self, data):
+        if not len(data):
+            return
+        if self.chunked:
+            data = "{0:x}\r\n".format(len(data)).encode('ascii') + data + b"\r\n"
+        self.wfile.write(data)
+
+    def close(self):
+        """Writes the remaining data and ends the response
+
+        """
+        self.flush()
+        if self._compressor is not None:
+            self._write(self._compressor.flush())
+        if self.chunked:
+            self.wfile.write(b"0\r\n\r\n")
@@ -1,4 +1,5 @@
 from .backend import Backend
+from .connectionpool import ConnectionPool
 from .elasticsearch import Elasticsearch
 
 __author__ = 'James DeVincentis <james.d@hexhost.net>'
@@ -4,7 +4,7 @@ __author__ = 'James DeVincentis <james.d@hexhost.net>'
 class Backend(object):
 
     # Connects to backend storage
-    def connect(self, connect_string):
+    def connect(self, connect_string, timeout=60):
         raise NotImplementedError("This must be implemented in the backend storage class")
 
     # Disconnects from backend storage
@@ -18,7 +18,19 @@ class Backend(object):
     # Searches observables
     def observable_search(self, params, start=None, number=None, count_only=False):
         raise NotImplementedError("This must be implemented in the backend storage class")
+
+    # Searches observables, yielding them page by page
+    def observable_search_iter(self, params, start=None, number=None, page_size=1000, raw=False, fields=None):
+        raise NotImplementedError("This must be implemented in the backend storage class")
         
+    # Searches observables one scroll page at a time
+    def observable_scroll(self, params, number, cursor=None, keepalive='5m', raw=False, fields=None):
+        raise NotImplementedError("This must be implemented in the backend storage class")
+
+    # Releases a scroll cursor before it expires
+    def observable_scroll_clear(self, cursor):
+        raise NotImplementedError("This must be implemented in the backend storage class")
+
     # Creates a new observable
     def observable_create(self, observable):
         raise NotImplementedError("This must be implemented in the backend storage class")
@@ -31,6 +43,10 @@ class Backend(object):
     def token_get(self, token_id):
         raise NotImplementedError("This must be implemented in the backend storage class")
 
+    # Gets several tokens at once
+    def token_get_many(self, token_ids):
+        raise NotImplementedError("This must be implemented in the backend storage class")
+
     # Puts a new token in the backend
     def token_create(self, token):
         raise NotImplementedError("This must be implemented in the backend storage class")
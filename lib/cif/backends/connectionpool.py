@@ -0,0 +1,161 @@
+import collections
+import http.client
+import socket
+import threading
+import time
+import urllib.parse
+
+__author__ = 'James DeVincentis <james.d@hexhost.net>'
+
+
+class ConnectionPool(object):
+    def __init__(self, urls, timeout=60, maxsize=10, dead_timeout=30):
+        """Thread safe pool of persistent (keep-alive) HTTP connections spread across one or more nodes
+
+        :param list urls: well formed URLs for each node. Nodes are used round-robin
+        :param int timeout: Socket timeout in seconds applied to every request
+        :param int maxsize: Maximum number of idle connections kept open per node
+        :param int dead_timeout: Seconds a failed node is skipped before it is tried again
+        :raises NotImplementedError:
+        :raises ValueError:
+        """
+        self.timeout = timeout
+        self.maxsize = maxsize
+        self.dead_timeout = dead_timeout
+        self.nodes = []
+
+        for url in urls:
+            if "://" not in url:
+                url = "http://" + url
+            parsed = urllib.parse.urlparse(url)
+            if parsed.scheme not in ["http", "https"]:
+                raise NotImplementedError("Connection Protocol {0:s} not supported".format(parsed.scheme))
+            self.nodes.append((parsed.scheme, parsed.netloc))
+
+        if not len(self.nodes):
+            raise ValueError("At least one node is required")
+
+        self._idle = dict((node, collections.deque()) for node in self.nodes)
+        self._dead = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _select(self):
+        """Picks the next live node round-robin. Nodes whose dead timeout has passed are considered live again. If
+        every node is dead the one that failed the longest time ago is used.
+
+        :return: (scheme, netloc) tuple
+        :rtype: tuple
+        """
+        now = time.time()
+        with self._lock:
+            for x in range(0, len(self.nodes)):
+                node = self.nodes[self._next % len(self.nodes)]
+                self._next += 1
+                if node not in self._dead or self._dead[node] <= now:
+                    return node
+            return min(self._dead, key=self._dead.get)
+
+    def _get(self, node, fresh=False):
+        """Gets an idle connection for `node` or opens a new one
+
+        :param tuple node: (scheme, netloc) tuple
+        :param bool fresh: Always open a new connection instead of reusing an idle one
+        :return: Tuple of the connection and a boolean indicating if it was reused
+        :rtype: tuple
+        """
+        with self._lock:
+            if not fresh and len(self._idle[node]):
+                return self._idle[node].pop(), True
+        if node[0] == "https":
+            return http.client.HTTPSConnection(node[1], timeout=self.timeout), False
+        return http.client.HTTPConnection(node[1], timeout=self.timeout), False
+
+    def _put(self, node, conn):
+        """Returns a connection to the idle list for `node`. Closes it if the pool is full
+
+        :param tuple node: (scheme, netloc) tuple
+        :param http.client.HTTPConnection conn: Connection to return
+        """
+        with self._lock:
+            if len(self._idle[node]) < self.maxsize:
+                self._idle[node].append(conn)
+                return
+        conn.close()
+
+    def mark_dead(self, node):
+        """Takes `node` out of rotation for `dead_timeout` seconds after a connection level failure
+
+        :param tuple node: (scheme, netloc) tuple
+        """
+        with self._lock:
+            self._dead[node] = time.time() + self.dead_timeout
+
+    def mark_live(self, node):
+        """Puts `node` back in rotation after a successful request
+
+        :param tuple node: (scheme, netloc) tuple
+        """
+        with self._lock:
+            self._dead.pop(node, None)
+
+    def urlopen(self, method, path, body=None):
+        """Sends a request to the next available node. Connection level failures are retried on the remaining nodes.
+
+        :param str method: HTTP request method to use
+        :param str path: URL Path
+        :param body: HTTP request body to send
+        :type body: str or bytes or None
+        :return: Tuple of status, reason and the raw response body
+        :rtype: tuple
+        :raises: ConnectionError
+        """
+        error = None
+        for attempt in range(0, len(self.nodes)):
+            node = self._select()
+            conn, reused = self._get(node)
+            try:
+                try:
+                    response = self._send(conn, method, path, body)
+                except (http.client.HTTPException, ConnectionError):
+                    # Keep-alive connections may have been closed by the node while idle; retry once on a fresh one
+                    conn.close()
+                    if not reused:
+                        raise
+                    conn, reused = self._get(node, fresh=True)
+                    response = self._send(conn, method, path, body)
+            except (http.client.HTTPException, socket.error) as e:
+                conn.close()
+                self.mark_dead(node)
+                error = e
+                continue
+
+            if response[3]:
+                conn.close()
+            else:
+                self._put(node, conn)
+            self.mark_live(node)
+            return response[:3]
+
+        raise ConnectionError("No backend nodes available") from error
+
+    @staticmethod
+    def _send(conn, method, path, body):
+        """Sends a single request on `conn` and reads the entire response so the connection can be reused
+
+        :return: Tuple of status, reason, raw response body and whether the connection will be closed
+        :rtype: tuple
+        """
+        conn.request(method, path, body)
+        response = conn.getresponse()
+        data = response.read()
+        return response.status, response.reason, data, response.will_close
+
+    def close(self):
+        """Closes all idle connections
+
+        """
+        with self._lock:
+            for node, connections in self._idle.items():
+                while len(connections):
+                    connections.pop().close()
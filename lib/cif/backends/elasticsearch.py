@@ -1,10 +1,11 @@
 import datetime
-import http.client
 import json
+import urllib.parse
 
 import dateutil.parser
 
 from . import Backend
+from .connectionpool import ConnectionPool
 
 __author__ = 'James DeVincentis <james.d@hexhost.net>'
 
@@ -14,30 +15,21 @@ class Elasticsearch(Backend):
         self.conn = None
         self.connect_string = None
 
-    def connect(self, connect_string):
+    def connect(self, connect_string, timeout=60):
         """Connects to the backend and performs a basic status check
 
-        :param str connect_string: well formed URL for the ElasticSearch HTTP API
+        :param str connect_string: well formed URL for the ElasticSearch HTTP API. Multiple nodes can be given as a
+            comma separated list and are used round-robin with failover
+        :param int timeout: Socket timeout in seconds for each request
         :raises NotImplementedError:
         """
         self.connect_string = connect_string
-        
-        if "://" in connect_string:
-            (method, url) = connect_string.split("://")
-        else:
-            method = 'http'
-            url = connect_string
 
-        if method == "http":
-            self.conn = http.client.HTTPConnection(url)
-        elif method == "https":
-            self.conn = http.client.HTTPSConnection(url)
-        else:
-            raise NotImplementedError("Connection Protocol {0:s} not supported".format(method))
-        
+        self.conn = ConnectionPool([url.strip() for url in connect_string.split(",") if url.strip()],
+                                   timeout=timeout)
+
         self.ping()
-        
-        
+
     def disconnect(self):
         """Disconnects from the backend storage.
 
@@ -54,13 +46,9 @@ class Elasticsearch(Backend):
         :raises: RuntimeError
         """
         try:
-            self._request(path="/", ping=False)
+            self._request(path="/")
         except Exception as e:
-            try:
-                self.disconnect()
-                self.connect(self.connect_string)
-            except:
-                raise RuntimeError("Ping failed") from e
+            raise RuntimeError("Ping failed") from e
 
     def observable_search(self, params, start=None, number=None, count_only=False):
         """Uses a list of parameters to build a query and then return the objects from the ElasticSearch backend
@@ -109,6 +97,128 @@ class Elasticsearch(Backend):
 
         return observables
 
+    def observable_search_iter(self, params, start=None, number=None, page_size=1000, raw=False, fields=None):
+        """Like :py:meth:`observable_search` but fetches results in pages of `page_size` hits and yields each observable
+        as its page is decoded, so memory use doesn't grow with `number`
+
+        :param dict params: Parameters to use to build the search string
+        :param start: Record number to start at
+        :type start: None or int
+        :param number: Maximum number of records to retrieve. If None all matching records are retrieved
+        :type number: None or int
+        :param int page_size: Number of records requested from ElasticSearch at a time
+        :param bool raw: Yield the stored documents as dictionaries instead of building observable objects
+        :param fields: Only include these fields in raw documents. ElasticSearch only sends these fields. All fields
+            if None
+        :type fields: None or list[str]
+        :return: Generator of retrieved observable objects (cif.type.Observable) or dictionaries if `raw` is set
+        :rtype: generator
+        :raises: LookupError
+        :raises: RuntimeError
+        """
+        query = self._build_search_string(params)
+        if raw and fields is not None:
+            query["_source"] = fields
+        offset = start or 0
+        remaining = number
+
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            query["from"] = offset
+            query["size"] = size
+
+            try:
+                result = self._request(path='/cif.observables-*/observables/_search', body=query)
+            except Exception as e:
+                raise LookupError("Failed to get observables.") from e
+
+            if "hits" not in result.keys():
+                raise RuntimeError("Not A properly formatted Elasticsearch result")
+
+            hits = result["hits"]["hits"]
+            if not len(hits):
+                if offset == (start or 0):
+                    raise LookupError("No results from observable search")
+                return
+
+            for hit in hits:
+                yield self._source(hit, fields) if raw else self._object('observable', hit["_source"])
+
+            if len(hits) < size:
+                return
+            offset += len(hits)
+            if remaining is not None:
+                remaining -= len(hits)
+
+    def observable_scroll(self, params, number, cursor=None, keepalive='5m', raw=False, fields=None):
+        """Returns one page of observables using the ElasticSearch scroll API. Every page costs the same no matter how
+        deep into the results it is, unlike `from` / `size` paging.
+
+        :param dict params: Parameters to use to build the search string. Ignored when continuing from `cursor`
+        :param int number: Number of records per page. Fixed by the first request of a scroll
+        :param cursor: Cursor returned with the previous page or None to start a new scroll
+        :type cursor: None or dict
+        :param str keepalive: How long ElasticSearch keeps the scroll open between pages
+        :param bool raw: Return the stored documents as dictionaries instead of building observable objects
+        :param fields: Only include these fields in raw documents. ElasticSearch only sends these fields, which is
+            fixed by the first request of a scroll. All fields if None
+        :type fields: None or list[str]
+        :return: Tuple of a generator of observable objects (cif.type.Observable), or dictionaries if `raw` is set, and
+            the cursor for the next page, which is None after the last page
+        :rtype: tuple
+        :raises: LookupError
+        :raises: RuntimeError
+        """
+        try:
+            if cursor is None:
+                query = self._build_search_string(params)
+                query["size"] = number
+                if raw and fields is not None:
+                    query["_source"] = fields
+                result = self._request(path='/cif.observables-*/observables/_search?scroll={0}'.format(keepalive),
+                                       body=query)
+                seen = 0
+            else:
+                result = self._request(path='/_search/scroll', body={"scroll": keepalive, "scroll_id": cursor["id"]},
+                                       not_found=True)
+                seen = cursor["seen"]
+        except Exception as e:
+            raise LookupError("Failed to get observables.") from e
+
+        if "hits" not in result.keys():
+            raise LookupError("Cursor has expired or is not valid")
+
+        hits = result["hits"]["hits"]
+        if not len(hits):
+            raise LookupError("No results from observable search")
+
+        total = result["hits"]["total"]
+        if isinstance(total, dict):
+            total = total["value"]
+        seen += len(hits)
+
+        if seen < total:
+            next_cursor = {"id": result["_scroll_id"], "seen": seen}
+        else:
+            next_cursor = None
+            try:
+                self.observable_scroll_clear({"id": result["_scroll_id"]})
+            except RuntimeError:
+                # The scroll expires on its own
+                pass
+
+        if raw:
+            return (self._source(hit, fields) for hit in hits), next_cursor
+        return (self._object('observable', hit["_source"]) for hit in hits), next_cursor
+
+    def observable_scroll_clear(self, cursor):
+        """Releases a scroll that won't be read to its end. Scrolls that already expired are ignored.
+
+        :param dict cursor: Cursor returned by :py:meth:`observable_scroll`
+        :raises: RuntimeError
+        """
+        self._request(path='/_search/scroll', body={"scroll_id": [cursor["id"]]}, method='DELETE', not_found=True)
+
     def observable_clean(self, date):
         """Deletes all observables older than date
         
@@ -268,19 +378,61 @@ class Elasticsearch(Backend):
         :raises: LookupError
         """
 
+        # Tokens are stored with the token as their _id so a realtime GET finds them, even right after creation
         try:
-            result = self._request(path='/cif.tokens/tokens/_search',
-                                   body={"query": {"query_string": {"default_field": "token", "query": token_id}}})
+            result = self._request(path='/cif.tokens/tokens/{0:s}'.format(urllib.parse.quote(token_id, safe='')),
+                                   not_found=True)
         except Exception as e:
             raise RuntimeError("Failed to get a token.") from e
 
-        if "hits" not in result.keys():
+        # A missing token answers 404 with "found": false, a missing tokens index answers 404 with an error
+        if result.get("found") is False or result.get("status") == 404:
+            raise LookupError("Token not found")
+
+        if "found" not in result.keys():
             raise RuntimeError("Not an elasticsearch result")
 
-        if not len(result["hits"]["hits"]):
-            raise LookupError("Token not found")
+        return self._object('token', result["_source"])
+
+    def token_get_many(self, token_ids):
+        """Retrieves several tokens at once using the ElasticSearch multi get API
+
+        :param list[str] token_ids: 64 character token IDs
+        :return: Dictionary of token ID to token object. Tokens that don't exist are left out
+        :rtype: dict
+        :raises: RuntimeError
+        """
+        if not len(token_ids):
+            return {}
 
-        return self._object('token', result["hits"]["hits"][0]["_source"])
+        try:
+            result = self._request(path='/cif.tokens/tokens/_mget', body={"ids": list(token_ids)})
+        except Exception as e:
+            raise RuntimeError("Failed to get tokens.") from e
+
+        if "docs" not in result.keys():
+            raise RuntimeError("Not an elasticsearch result")
+
+        tokens = {}
+        for doc in result["docs"]:
+            if doc.get("found"):
+                tokens[doc["_id"]] = self._object('token', doc["_source"])
+        return tokens
+
+    @staticmethod
+    def _source(hit, fields=None):
+        """Returns the stored document of a search hit without the internal @ fields
+
+        :param dict hit: Search hit
+        :param fields: Only include these fields. All fields if None
+        :type fields: None or list[str]
+        :return: Stored document
+        :rtype: dict
+        """
+        source = hit["_source"]
+        if fields is not None:
+            return dict((field, source.get(field)) for field in fields)
+        return dict((field, value) for field, value in source.items() if not field.startswith("@"))
 
     @staticmethod
     def _object(object_type, params):
@@ -301,56 +453,46 @@ class Elasticsearch(Backend):
             del params[param]
         return obj(params, validation=False)
 
-    def _request(self, path='/', body=None, method="GET", ping=True):
-        """Send a request to the ElasticSearch API
+    def _request(self, path='/', body=None, method="GET", not_found=False):
+        """Send a request to the ElasticSearch API using a pooled keep-alive connection
 
         :param str path: URL Path
         :param body: HTTP request body to send
         :type body: list or dict
         :param str method: HTTP request method to use
+        :param bool not_found: Return the body of a 404 response instead of raising. Document GETs answer 404 with
+            `"found": false` for missing documents, missing indices with an error and `"status": 404`. A 404 without
+            a JSON body returns `{"status": 404}`
         :return: Parsed JSON data
         :rtype: dict of dict or list of dict of dict
         :raises: RuntimeError
         :raises: TimeoutError
         """
-        
-        # Ping the backend to make sure it's still alive
-        if ping:
-            self.ping()
-
-        args = [path]
-
         if body is not None:
             if isinstance(body, list):
-                tmp = ""
-                for key, line in enumerate(body):
-                    tmp += json.dumps(line) + "\n"
-                args.append(tmp)
+                body = "".join(json.dumps(line) + "\n" for line in body)
             else:
-                args.append(json.dumps(body))
+                body = json.dumps(body)
 
         try:
-            self.conn.request(method, *args)
+            (status, reason, data) = self.conn.urlopen(method, path, body)
         except Exception as e:
             raise RuntimeError("Backend storage timed out responding.") from e
 
-        try:
-            result = self.conn.getresponse()
-        except Exception as e:
-            raise RuntimeError('Backend error getting response.') from e
-
-        if result.status >= 400:
+        if status >= 400 and not (not_found and status == 404):
             raise RuntimeError(
-                "Backend error. Got '{0:d} {1:s}' status from the backend.".format(result.status, result.reason))
+                "Backend error. Got '{0:d} {1:s}' status from the backend.".format(status, reason))
 
         try:
-            data = result.read().decode('ISO8859-1')
+            data = data.decode('ISO8859-1')
         except Exception as e:
             raise RuntimeError("Backend error. Couldn't read result from request") from e
 
         try:
             data = json.loads(data)
         except Exception as e:
+            if status == 404:
+                return {"status": 404}
             raise RuntimeError("Backend error. Couldn't load JSON data from request:") from e
 
         if "timed_out" in data.keys() and data["timed_out"]:
@@ -0,0 +1,259 @@
+import collections
+import ipaddress
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+__author__ = 'James DeVincentis <james.d@hexhost.net>'
+
+
+class TTLCache(object):
+    def __init__(self, maxsize=100000, ttl=3600, maxbytes=0):
+        """
+        Thread safe cache that expires entries after a time to live and evicts the least recently used entry once it
+        holds `maxsize` entries, or once the sizes given for its entries add up to more than `maxbytes`
+
+        :param int maxsize: Maximum number of entries
+        :param int ttl: Default number of seconds an entry lives
+        :param int maxbytes: Maximum total size of the entries. 0 for no limit
+        :return: None
+        """
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._data = collections.OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        del self._data[key]
+        self.bytes -= self._sizes.pop(key, 0)
+
+    def _evict(self):
+        while len(self._data) > self.maxsize or (self.maxbytes and self.bytes > self.maxbytes):
+            self._remove(next(iter(self._data)))
+
+    def get(self, key, default=None):
+        """
+        Gets an entry from the cache
+
+        :param key: Key of the entry
+        :param default: Returned when the entry is missing or expired
+        :return: The cached value or `default`
+        """
+        with self._lock:
+            if key in self._data:
+                (value, expires) = self._data[key]
+                if expires > time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None, size=0):
+        """
+        Puts an entry into the cache. Entries larger than `maxbytes` are not cached.
+
+        :param key: Key of the entry
+        :param value: Value to store
+        :param ttl: Seconds the entry lives. Uses the cache default if None
+        :type ttl: int or None
+        :param int size: Size of the entry counted against `maxbytes`
+        :return: None
+        """
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            if self.maxbytes and size > self.maxbytes:
+                return
+            self._data[key] = (value, time.time() + ttl)
+            if size:
+                self._sizes[key] = size
+                self.bytes += size
+            self._evict()
+
+    def update(self, key, value):
+        """
+        Replaces the value of an unexpired entry without changing when it expires
+
+        :param key: Key of the entry
+        :param value: New value
+        :return: False if there is no unexpired entry for `key`
+        :rtype: bool
+        """
+        with self._lock:
+            if key not in self._data:
+                return False
+            expires = self._data[key][1]
+            if expires <= time.time():
+                self._remove(key)
+                return False
+            self._data[key] = (value, expires)
+            return True
+
+    def delete(self, key):
+        """
+        Removes an entry from the cache if it exists
+
+        :param key: Key of the entry
+        :return: None
+        """
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def keys(self):
+        """
+        Returns the keys of all unexpired entries
+
+        :return: List of keys
+        :rtype: list
+        """
+        now = time.time()
+        with self._lock:
+            return [key for key, entry in self._data.items() if entry[1] > now]
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """
+        Returns usage counters for sizing the cache
+
+        :return: Dictionary with the size, maximum size, hits, misses and hit rate
+        :rtype: dict
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {"size": len(self._data), "maxsize": self.maxsize, "bytes": self.bytes, "maxbytes": self.maxbytes,
+                    "hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+    def dump(self):
+        """
+        Returns all unexpired entries so they can be persisted
+
+        :return: Dictionary of key to (value, expires) tuples
+        :rtype: dict
+        """
+        now = time.time()
+        with self._lock:
+            return dict((key, entry) for key, entry in self._data.items() if entry[1] > now)
+
+    def load(self, entries):
+        """
+        Loads entries previously returned by :py:meth:`dump`
+
+        :param dict entries: Dictionary of key to (value, expires) tuples
+        :return: None
+        """
+        now = time.time()
+        with self._lock:
+            for key, (value, expires) in sorted(entries.items(), key=lambda item: item[1][1]):
+                if expires > now:
+                    self._data[key] = (value, expires)
+            self._evict()
+
+
+class PrefixCache(TTLCache):
+    def __init__(self, maxsize=100000, ttl=3600):
+        """
+        TTL cache keyed on network prefixes. Looking up an address returns the value stored for the longest prefix
+        containing it.
+
+        :param int maxsize: Maximum number of prefixes
+        :param int ttl: Default number of seconds an entry lives
+        :return: None
+        """
+        TTLCache.__init__(self, maxsize=maxsize, ttl=ttl)
+        # (ip version, prefix length) pairs that have been cached so lookups only try lengths that can match
+        self._lengths = set()
+
+    def lookup(self, address):
+        """
+        Finds the value cached for the longest prefix containing `address`
+
+        :param address: Address to look up
+        :type address: ipaddress.IPv4Address or ipaddress.IPv6Address
+        :return: The cached value or None
+        """
+        bits = address.max_prefixlen
+        now = time.time()
+        with self._lock:
+            for version, length in sorted(self._lengths, key=lambda x: x[1], reverse=True):
+                if version != address.version:
+                    continue
+                key = (version, length, int(address) >> (bits - length) << (bits - length))
+                if key in self._data:
+                    (value, expires) = self._data[key]
+                    if expires > now:
+                        self._data.move_to_end(key)
+                        self.hits += 1
+                        return value
+                    self._remove(key)
+            self.misses += 1
+            return None
+
+    def insert(self, prefix, value, ttl=None):
+        """
+        Caches `value` for every address inside `prefix`
+
+        :param str prefix: Network prefix in CIDR notation
+        :param value: Value to store
+        :param ttl: Seconds the entry lives. Uses the cache default if None
+        :type ttl: int or None
+        :return: None
+        """
+        network = ipaddress.ip_network(prefix, strict=False)
+        with self._lock:
+            self._lengths.add((network.version, network.prefixlen))
+        self.set((network.version, network.prefixlen, int(network.network_address)), value, ttl)
+
+    def load(self, entries):
+        TTLCache.load(self, entries)
+        with self._lock:
+            self._lengths = set(key[:2] for key in self._data.keys())
+
+
+def load(path, caches):
+    """
+    Loads caches persisted with :py:func:`save`. Missing or unreadable files are ignored.
+
+    :param str path: File the caches were saved to
+    :param dict caches: Dictionary of name to cache to load into
+    :return: None
+    """
+    try:
+        with open(path, 'rb') as handle:
+            saved = pickle.load(handle)
+    except Exception:
+        return
+    for name, cache in caches.items():
+        if name in saved:
+            cache.load(saved[name])
+
+
+def save(path, caches):
+    """
+    Persists caches to `path`. The file is replaced atomically so several worker processes can share it.
+
+    :param str path: File to save the caches to
+    :param dict caches: Dictionary of name to cache to save
+    :return: None
+    """
+    (handle, temp) = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(handle, 'wb') as stream:
+            pickle.dump(dict((name, cache.dump()) for name, cache in caches.items()), stream)
+        os.replace(temp, path)
+    except Exception:
+        os.unlink(temp)
+        raise
@@ -1,6 +1,9 @@
 from .feeder import Feeder
 from .feed import Feed
 from .parser import Parser
+from .blacklist import Blacklist
+from .downloads import DownloadCache
+from . import stream
 from . import parsers
 
 __author__ = 'James DeVincentis <james.d@hexhost.net>'
@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+
+import netaddr
+import yaml
+
+import cif
+
+__author__ = 'James DeVincentis <james.d@hexhost.net>'
+
+
+class Blacklist(object):
+    def __init__(self, path, check_interval=5):
+        """Blacklist of networks and domains compiled into lookup tables. Networks are kept in one set of network bits per
+        (ip version, prefix length) and domains in a set, so a check costs one lookup per prefix length or domain label
+        no matter how long the blacklist is. The file is loaded again when it changes.
+
+        :param str path: Path to the blacklist YAML file
+        :param int check_interval: Seconds between checks of the file for changes
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self.logging = cif.logging.getLogger('BLACKLIST')
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked = None
+        self._loaded = False
+        # (ip version, prefix length) -> set of network bits
+        self._networks = {}
+        self._domains = set()
+
+    def refresh(self):
+        """Loads the blacklist again if the file changed since it was last loaded. If loading fails the previously
+        loaded blacklist is kept and loading is retried after `check_interval` seconds.
+
+        """
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self.check_interval:
+            return
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except FileNotFoundError:
+                mtime = 0
+            if self._loaded and mtime == self._mtime:
+                return
+            self._load(mtime)
+
+    def _load(self, mtime):
+        entries = []
+        if mtime:
+            try:
+                with open(self.path, 'r') as handle:
+                    entries = yaml.safe_load(handle) or []
+            except Exception as e:
+                self.logging.error("Could not load blacklist '{0}': {1}".format(self.path, e))
+                return
+
+        networks = {}
+        domains = set()
+        for entry in entries:
+            try:
+                network = netaddr.IPNetwork(entry)
+                networks.setdefault((network.version, network.prefixlen), set()).add(
+                    network.value >> ((32 if network.version == 4 else 128) - network.prefixlen)
+                )
+            except (netaddr.core.AddrFormatError, TypeError, ValueError):
+                domain = str(entry).strip().lower().lstrip('*.').rstrip('.')
+                if len(domain):
+                    domains.add(domain)
+
+        self._networks = networks
+        self._domains = domains
+        self._mtime = mtime
+        self._loaded = True
+        self.logging.debug("Loaded {0} networks and {1} domains from blacklist '{2}'".format(
+            sum(len(x) for x in networks.values()), len(domains), self.path)
+        )
+
+    def check_network(self, network):
+        """Checks if an address or network is inside a blacklisted network
+
+        :param netaddr.IPNetwork network: Address or network to check
+        :return: True if it is blacklisted
+        :rtype: bool
+        """
+        width = 32 if network.version == 4 else 128
+        for (version, length), values in self._networks.items():
+            if version == network.version and length <= network.prefixlen and \
+                    network.value >> (width - length) in values:
+                return True
+        return False
+
+    def check_domain(self, domain):
+        """Checks if a domain or any of its parent domains is blacklisted
+
+        :param str domain: Domain to check
+        :return: True if it is blacklisted
+        :rtype: bool
+        """
+        labels = domain.strip().lower().rstrip('.').split('.')
+        for index in range(0, len(labels)):
+            if '.'.join(labels[index:]) in self._domains:
+                return True
+        return False
+
+    def check(self, observable):
+        """Checks if an observable is blacklisted. Observables that are IP addresses or networks are matched against
+        the blacklisted networks, anything else is matched against the blacklisted domains and their subdomains.
+
+        :param str observable: Observable to check
+        :return: True if it is blacklisted
+        :rtype: bool
+        :raises: RuntimeError
+        """
+        self.refresh()
+        if not self._loaded:
+            raise RuntimeError("Blacklist '{0}' could not be loaded".format(self.path))
+        try:
+            return self.check_network(netaddr.IPNetwork(observable))
+        except (netaddr.core.AddrFormatError, TypeError, ValueError):
+            return self.check_domain(observable)
@@ -0,0 +1,124 @@
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import cif
+from . import stream
+
+__author__ = 'James DeVincentis <james.d@hexhost.net>'
+
+
+class DownloadCache(object):
+    def __init__(self, directory, ttl=900):
+        """Keeps the decompressed body of downloaded feeds on disk so feeds sharing a remote only fetch and decompress
+        it once. Entries are shared between feed processes, a lock file per entry makes sure only one of them fetches.
+
+        :param str directory: Directory to keep downloads in
+        :param int ttl: Seconds a download is reused before it is fetched again
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.logging = cif.logging.getLogger('DOWNLOADS')
+
+    @staticmethod
+    def key(remote, method="GET", username=None, password=None):
+        """Builds the cache key for a download
+
+        :param str remote: URL of the feed
+        :param str method: HTTP method used to fetch it
+        :param username: Username used to fetch it
+        :type username: None or str
+        :param password: Password used to fetch it
+        :type password: None or str
+        :return: Cache key
+        :rtype: str
+        """
+        return hashlib.sha256(json.dumps([remote, method.upper(), username, password]).encode('utf-8')).hexdigest()
+
+    def get(self, key, fetch):
+        """Returns the cached download for `key`, fetching it first if there is no fresh copy
+
+        :param str key: Cache key from :py:meth:`key`
+        :param fetch: Callable taking a dictionary of conditional request headers and returning a streaming
+                      :py:class:`requests.Response`
+        :return: Path to the decompressed body and its SHA256
+        :rtype: tuple
+        :raises: RuntimeError
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, key)
+
+        with open("{0}.lock".format(path), 'w') as lock:
+            # Feeds sharing the download wait here while the first one fetches it
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            meta = self._load(path)
+            if meta is not None and time.time() - meta["fetched"] < self.ttl:
+                self.logging.debug("Using cached download '{0}'".format(path))
+                return path, meta["sha256"]
+
+            headers = {}
+            if meta is not None and "etag" in meta:
+                headers['If-None-Match'] = meta["etag"]
+            if meta is not None and "last_modified" in meta:
+                headers['If-Modified-Since'] = meta["last_modified"]
+
+            response = fetch(headers)
+            try:
+                if response.status_code == 304 and meta is not None:
+                    self.logging.debug("Cached download '{0}' has not been modified".format(path))
+                    meta["fetched"] = time.time()
+                    self._save(path, meta)
+                    return path, meta["sha256"]
+
+                if response.status_code > 300:
+                    raise RuntimeError("{0} {1}".format(response.status_code, response.reason))
+
+                meta = {"fetched": time.time()}
+                if "ETag" in response.headers:
+                    meta["etag"] = response.headers["ETag"]
+                if "Last-Modified" in response.headers:
+                    meta["last_modified"] = response.headers["Last-Modified"]
+
+                response.raw.decode_content = True
+                meta["sha256"] = self._write(path, stream.open_binary(response.raw))
+            finally:
+                response.close()
+
+            self._save(path, meta)
+            self.logging.debug("Cached download '{0}'".format(path))
+            return path, meta["sha256"]
+
+    def _load(self, path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open("{0}.json".format(path), 'r') as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, path, meta):
+        with open("{0}.json".format(path), 'w') as handle:
+            json.dump(meta, handle)
+
+    def _write(self, path, source):
+        # Write next to the cached copy and swap it in once complete so a failed fetch leaves the old copy intact
+        digest = hashlib.sha256()
+        (handle, temp) = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(handle, 'wb') as output:
+                while True:
+                    data = source.read(stream.CHUNK_SIZE)
+                    if not len(data):
+                        break
+                    digest.update(data)
+                    output.write(data)
+            os.replace(temp, path)
+        except Exception:
+            os.unlink(temp)
+            raise
+        return digest.hexdigest()
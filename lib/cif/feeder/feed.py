@@ -1,10 +1,7 @@
 import datetime
-import gzip
 import json
 import multiprocessing
 import os
-import tempfile
-import zipfile
 
 import pika
 import requests
@@ -68,70 +65,106 @@ class Feed(multiprocessing.Process):
         )
         self.logging.debug("Built Journal Path: {0}".format(feed_parsing_details['journal']))
 
+        feed_parsing_details["validators"] = "{0}/{1}-{2}-validators.json".format(
+            cif.CACHEDIR, os.path.basename(self.feed_config['filename'].lower()), self.feed_name.lower()
+        )
+        validators = self.loadvalidators(feed_parsing_details["validators"])
+        # Validators only hold for the journal they were recorded with so every feed is still sent once a day
+        if validators.get("journal") != feed_parsing_details["journal"] or \
+                validators.get("remote") != feed_parsing_details["remote"]:
+            validators = {}
+        new_validators = {"journal": feed_parsing_details["journal"], "remote": feed_parsing_details["remote"]}
+
+        response = None
         if feed_parsing_details["remote"].startswith('/'):
             self.logging.debug("Local file detected '{0}'. Opening Locally.".format(feed_parsing_details["remote"]))
-            temp = open(feed_parsing_details["remote"], "rb")
+            stat = os.stat(feed_parsing_details["remote"])
+            new_validators["mtime"] = stat.st_mtime
+            new_validators["size"] = stat.st_size
+            if validators.get("mtime") == stat.st_mtime and validators.get("size") == stat.st_size:
+                self.logging.info("Feed '{0}' has not been modified. Skipping.".format(feed_parsing_details["remote"]))
+                self.connection.close()
+                return
+            source = open(feed_parsing_details["remote"], "rb")
+        elif self.is_shared(feed_parsing_details) and cif.options.feed_download_cache_ttl > 0:
+            self.logging.debug("Remote file shared with other feeds detected '{0}'. Using download cache.".format(
+                feed_parsing_details["remote"])
+            )
+            downloads = cif.feeder.DownloadCache(os.path.join(cif.CACHEDIR, 'downloads'),
+                                                 ttl=cif.options.feed_download_cache_ttl)
+            key = downloads.key(feed_parsing_details["remote"], feed_parsing_details["method"],
+                                feed_parsing_details.get("username"), feed_parsing_details.get("password"))
+            try:
+                (path, digest) = downloads.get(key, lambda headers: self.request(feed_parsing_details, headers))
+            except:
+                self.logging.exception("Could not fetch remote url '{0}'".format(feed_parsing_details["remote"]))
+                return
+
+            if validators.get("sha256") == digest:
+                self.logging.info("Feed '{0}' has not changed. Skipping.".format(feed_parsing_details["remote"]))
+                self.connection.close()
+                return
+            new_validators["sha256"] = digest
+            source = open(path, "rb")
         else:
             self.logging.debug("Remote file detected '{0}'. Opening remotely.".format(
                 feed_parsing_details["remote"])
             )
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 6.3; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) '
-                              'Chrome/45.0.2454.93 Safari/537.36'
-            }
+            headers = {}
+            if "etag" in validators:
+                headers['If-None-Match'] = validators["etag"]
+            if "last_modified" in validators:
+                headers['If-Modified-Since'] = validators["last_modified"]
             try:
-                response = requests.request(feed_parsing_details["method"], feed_parsing_details["remote"],
-                                            proxies=cif.proxies, stream=True, headers=headers, verify=False, timeout=300
-                                            )
+                response = self.request(feed_parsing_details, headers)
             except:
                 self.logging.exception("Could not fetch remote url '{0}'".format(feed_parsing_details["remote"]))
                 return
 
+            if response.status_code == 304:
+                self.logging.info("Feed '{0}' has not been modified. Skipping.".format(feed_parsing_details["remote"]))
+                response.close()
+                self.connection.close()
+                return
+
             if response.status_code > 300:
                 self.logging.error("Failed fetching remote feed '{0}': {1} {2}".format(
                     feed_parsing_details["remote"], response.status_code, response.reason)
                 )
+                response.close()
                 return
 
-            temp = tempfile.TemporaryFile(mode="w+b")
-
-            for chunk in response.iter_content(1024 * 1024):
-                temp.write(chunk)
-
-            response.close()
+            if "ETag" in response.headers:
+                new_validators["etag"] = response.headers["ETag"]
+            if "Last-Modified" in response.headers:
+                new_validators["last_modified"] = response.headers["Last-Modified"]
 
-            self.logging.debug("Wrote {0} bytes to binary file.".format(temp.tell()))
+            # Read the body straight off the connection. Transfer encodings like gzip are undone by requests
+            response.raw.decode_content = True
+            source = cif.feeder.stream.HashingReader(response.raw)
 
-            temp.seek(0)
+            # Without validators from the server the only way to tell the feed hasn't changed is its hash, which needs
+            # the whole body before parsing starts
+            if "etag" not in new_validators and "last_modified" not in new_validators and "sha256" in validators:
+                spooled = cif.feeder.stream.spool(source)
+                response.close()
+                if source.hexdigest() == validators["sha256"]:
+                    self.logging.info("Feed '{0}' has not changed. Skipping.".format(feed_parsing_details["remote"]))
+                    spooled.close()
+                    self.connection.close()
+                    return
+                new_validators["sha256"] = source.hexdigest()
+                source = spooled
 
-        zip_file = None
-        if zipfile.is_zipfile(temp):
-            zip_file = zipfile.ZipFile(temp)
-            temp_bin = zip_file.open(zip_file.namelist()[0])
-        else:
-            temp_bin = temp
-            temp_bin.seek(0)
-
-        if zip_file is None:
-            test_header = temp.read(2)
-            temp.seek(0)
-            if test_header == b'\x1f\x8b':
-                temp_bin = gzip.open(temp)
-            else:
-                temp_bin = temp
-
-        file_to_parse = tempfile.TemporaryFile(mode="w+", encoding="ISO8859-1")
-        while True:
-            buf = temp_bin.read(1024 * 1024)
-            if len(buf) == 0:
-                break
-            file_to_parse.write(buf.decode("ISO8859-1"))
-        self.logging.debug("Wrote {0} bytes to text file.".format(file_to_parse.tell()))
-        file_to_parse.seek(0)
-
-        if zip_file is not None:
-            zip_file.close()
-        temp_bin.close()
+        # The body is decompressed and decoded as the parser reads it instead of being copied to disk first
+        try:
+            file_to_parse = cif.feeder.stream.open_text(source)
+        except Exception:
+            self.logging.exception("Could not open feed '{0}'".format(feed_parsing_details["remote"]))
+            source.close()
+            if response is not None:
+                response.close()
+            return
 
         self.logging.debug("Creating Parser for feed {0}".format(feed_parsing_details['remote']))
         parser = Parser(parsing_details=feed_parsing_details, basemeta=feed_meta, file=file_to_parse)
@@ -152,6 +185,78 @@ class Feed(multiprocessing.Process):
                         )
                     )
 
+        if isinstance(source, cif.feeder.stream.HashingReader) and source.eof:
+            new_validators["sha256"] = source.hexdigest()
         file_to_parse.close()
+        source.close()
+        if response is not None:
+            response.close()
         self.connection.close()
+        self.savevalidators(feed_parsing_details["validators"], new_validators)
         self.logging.debug("Finished Parsing feed {0}".format(feed_parsing_details['remote']))
+
+    def is_shared(self, feed_parsing_details):
+        """Checks if another feed in the same feed file downloads the same remote the same way
+
+        :param dict feed_parsing_details: Parsing details of this feed
+        :return: True if the download can be shared
+        :rtype: bool
+        """
+        for feed_name, feed in self.feed_config['feeds'].items():
+            if feed_name == self.feed_name:
+                continue
+            if feed.get("remote") == feed_parsing_details["remote"] and \
+                    feed.get("method", "GET") == feed_parsing_details["method"] and \
+                    feed.get("username") == feed_parsing_details.get("username") and \
+                    feed.get("password") == feed_parsing_details.get("password"):
+                return True
+        return False
+
+    def request(self, feed_parsing_details, headers=None):
+        """Makes the HTTP request for a remote feed
+
+        :param dict feed_parsing_details: Parsing details of the feed
+        :param dict headers: Additional request headers
+        :return: Streaming response
+        :rtype: requests.Response
+        :raises: requests.exceptions.RequestException
+        """
+        request_headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 6.3; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                          'Chrome/45.0.2454.93 Safari/537.36'
+        }
+        if headers is not None:
+            request_headers.update(headers)
+        return requests.request(feed_parsing_details["method"], feed_parsing_details["remote"], proxies=cif.proxies,
+                                stream=True, headers=request_headers, verify=False, timeout=300)
+
+    def loadvalidators(self, path):
+        """Loads the validators saved for a feed the last time it was fetched
+
+        :param str path: Path of the validators file
+        :return: Validators (etag, last_modified, sha256, mtime, size and the remote and journal they belong to)
+        :rtype: dict
+        """
+        if cif.options.feed_disable_conditional or not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r') as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            self.logging.warning("Could not read feed validators from '{0}'".format(path))
+            return {}
+
+    def savevalidators(self, path, validators):
+        """Saves the validators of a feed that was fetched and parsed completely
+
+        :param str path: Path of the validators file
+        :param dict validators: Validators to save
+        """
+        if cif.options.feed_disable_conditional:
+            return
+        self.logging.debug("Writing validators to '{0}'".format(path))
+        try:
+            with open(path, 'w') as handle:
+                json.dump(validators, handle)
+        except OSError:
+            self.logging.warning("Could not write feed validators to '{0}'".format(path))
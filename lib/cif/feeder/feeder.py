@@ -1,7 +1,10 @@
+import collections
 import multiprocessing
 import os
+import random
 import setproctitle
 import time
+import urllib.parse
 
 import schedule
 import watchdog.events
@@ -44,6 +47,11 @@ class Feeder(multiprocessing.Process):
         self.logging = cif.logging.getLogger('FEEDER')
         self.reloader = FeedReloadSignaler()
         cif.feeder.do_reload = True
+        self.feeds = {}
+
+        # Feeds waiting for a free slot as (feed_file, feed_name, earliest start time) and the running feed processes
+        self.pending = collections.deque()
+        self.running = {}
 
         # Create our watchdog to signal for reloading Feeds
         self.watchdog = watchdog.observers.Observer()
@@ -109,9 +117,66 @@ class Feeder(multiprocessing.Process):
                     )
 
     def _run_feed(self, feed_file, feed_name):
-        process = cif.feeder.Feed(feed_config=self.feeds[feed_file], feed_name=feed_name)
-        process.start()
-        process.join()
+        """Queues a feed to be run. Feeds are started with a random delay of up to `feed_jitter` seconds so feeds
+        scheduled for the same time don't all hit their remotes at once.
+
+        :param str feed_file: Path of the feed file
+        :param str feed_name: Name of the feed in the feed file
+        """
+        if (feed_file, feed_name) in self.running or \
+                any(job[0] == feed_file and job[1] == feed_name for job in self.pending):
+            self.logging.warning("Feed '{0}' from '{1}' is still running. Skipping this run.".format(
+                feed_name, feed_file)
+            )
+            return
+        self.pending.append((feed_file, feed_name, time.time() + random.uniform(0, cif.options.feed_jitter)))
+
+    def _feed_host(self, feed_file, feed_name):
+        remote = self.feeds[feed_file]['feeds'][feed_name].get('remote', '')
+        if remote.startswith('/'):
+            return None
+        return urllib.parse.urlparse(remote).hostname
+
+    def _reap_feeds(self):
+        for job, (process, host) in list(self.running.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del self.running[job]
+            self.logging.debug("Feed '{0}' from '{1}' finished with exit code {2}".format(
+                job[1], job[0], process.exitcode)
+            )
+
+    def _start_feeds(self):
+        """Starts queued feeds that are due while there are free slots. At most `feed_concurrency` feeds run at once,
+        and at most `feed_host_concurrency` of them fetch from the same host.
+
+        """
+        now = time.time()
+        waiting = collections.deque()
+        while len(self.pending):
+            (feed_file, feed_name, start) = self.pending.popleft()
+
+            # The feed was removed by a reload while it was waiting
+            if feed_file not in self.feeds or feed_name not in self.feeds[feed_file]['feeds']:
+                continue
+
+            host = self._feed_host(feed_file, feed_name)
+            host_running = sum(1 for (process, running_host) in self.running.values() if running_host == host)
+            if start > now or len(self.running) >= cif.options.feed_concurrency or \
+                    (host is not None and host_running >= cif.options.feed_host_concurrency):
+                waiting.append((feed_file, feed_name, start))
+                continue
+
+            self.logging.info("Starting feed '{0}' from '{1}'".format(feed_name, feed_file))
+            try:
+                process = cif.feeder.Feed(feed_config=self.feeds[feed_file], feed_name=feed_name)
+                process.start()
+            except Exception:
+                self.logging.exception("Could not start feed '{0}' from '{1}'".format(feed_name, feed_file))
+                continue
+            self.running[(feed_file, feed_name)] = (process, host)
+        self.pending = waiting
 
     def _load_feed(self, feed_file):
         try:
@@ -153,6 +218,8 @@ class Feeder(multiprocessing.Process):
         while True:
 
             schedule.run_pending()
+            self._reap_feeds()
+            self._start_feeds()
             if cif.feeder.do_reload:
                 self._do_reload()
                 cif.feeder.do_reload = False
@@ -2,8 +2,6 @@ import copy
 import os
 import pickle
 import re
-import yaml
-import netaddr
 
 import cif
 
@@ -15,8 +13,7 @@ class Parser(object):
         self.basemeta = kwargs["basemeta"]
         self.parsing_details = kwargs["parsing_details"]
         self.parsing = True
-        self.filter_ips = []
-        self.filter_hosts = []
+        self.blacklist = None
         self.journal = None
         self.new_journal = None
         self.total_objects = 0
@@ -85,29 +82,16 @@ class Parser(object):
         return meta
 
     def loadfilter(self):
-        t_path = os.path.sep.join([cif.ETCDIR, 'config', 'blacklist.yml'])
-        try:
-            buf = yaml.load(open(t_path, 'r').read())
+        if self.blacklist is None:
+            self.blacklist = cif.feeder.Blacklist(os.path.sep.join([cif.ETCDIR, 'config', 'blacklist.yml']))
 
-            for line in buf:
-                try:
-                    self.filter_ips.append(netaddr.IPNetwork(line))
-                except netaddr.core.AddrFormatError:
-                    self.filter_hosts.append(line)
-        except FileNotFoundError:
-            pass
-    
     def testfilter(self, test):
-        try:
-            ret = [True for x in self.filter_ips if test in x]
-        except netaddr.core.AddrFormatError:
-            ret = [True for x in self.filter_hosts if test in x]
-        return len(ret) > 0 and ret[0] is True
-        
+        return self.blacklist.check(test)
+
     def checkblacklist(self, meta):
         self.loadfilter()
         return self.testfilter(meta['observable'])
-        
+
     def checkjournal(self, observable):
         return observable not in self.journal
 
@@ -5,9 +5,7 @@ __author__ = 'James DeVincentis <james.d@hexhost.net>'
 
 class Delim(Parser):
     def __init__(self):
-        self.file.seek(0, 2)
-        self.file_size = self.file.tell()
-        self.file.seek(0)
+        self.line_number = 0
 
     def parsefile(self, max_objects=1000):
         """Parse file provided by self.file`. Return `max_objects` at a time. This is repetitively called
@@ -23,19 +21,22 @@ class Delim(Parser):
 
         if self.total_objects == 0 and "start" in self.parsing_details and self.parsing_details["start"] > 1:
             for x in range(1, self.parsing_details["start"]):
-                if self.file.tell() >= self.file_size:
+                if not len(self.file.readline()):
                     self.parsing = False
-                    return
-                self.file.readline()
+                    return observables
+                self.line_number += 1
                 self.total_objects += 1
 
         objects = 0
         while objects < max_objects:
-            if self.file.tell() >= self.file_size:
+            # The file is a stream, an empty read is the end of it
+            line = self.file.readline()
+            if not len(line):
                 self.parsing = False
                 break
+            self.line_number += 1
 
-            line = self.file.readline().strip()
+            line = line.strip()
 
             match = line.split(self.parsing_details["pattern"])
 
@@ -49,8 +50,8 @@ class Delim(Parser):
                 if line[0].startswith('#') or line[0].startswith(';') or len(line) == 0:
                     continue
                 self.logging.debug(
-                    "No Match - feed: {4}; position {0}; contents: '{1}'; match-count: {3}; values: {2}".format(
-                        self.file.tell(), match, len(self.parsing_details["values"]), len(match),
+                    "No Match - feed: {4}; line {0}; contents: '{1}'; match-count: {3}; values: {2}".format(
+                        self.line_number, match, len(self.parsing_details["values"]), len(match),
                         self.parsing_details['feed_name']
                     )
                 )
@@ -12,9 +12,7 @@ class Regex(Parser):
         except Exception as e:
             raise AttributeError("Regex is invalid: {0}".format(e))
 
-        self.file.seek(0, 2)
-        self.file_size = self.file.tell()
-        self.file.seek(0)
+        self.line_number = 0
 
     def parsefile(self, max_objects=1000):
         """Parse file provided by self.file`. Return `max_objects` at a time. This is repetitively called
@@ -30,34 +28,34 @@ class Regex(Parser):
 
         if self.total_objects == 0 and "start" in self.parsing_details and self.parsing_details["start"] > 1:
             for x in range(1, self.parsing_details["start"]):
-                if self.file.tell() >= self.file_size:
-                    self.parsing = False
-                    break
                 self.total_objects += 1
 
         objects = 0
         while objects <= max_objects:
-            if self.file.tell() >= self.file_size:
+            # The file is a stream, an empty read is the end of it
+            line = self.file.readline()
+            if not len(line):
                 self.parsing = False
                 break
+            self.line_number += 1
 
-            line = self.file.readline().strip()
+            line = line.strip()
             if line.startswith('#'):
                 continue
             match = self.regex.search(line)
 
             if match is None:
                 if not line.startswith('#') and not line.startswith(';') and not len(line) == 0:
-                    self.logging.debug("No Match - position {0}; contents: '{1}'; match: {2}; values: {3}".format(
-                        self.file.tell(), line, repr(match), len(self.parsing_details["values"]))
+                    self.logging.debug("No Match - line {0}; contents: '{1}'; match: {2}; values: {3}".format(
+                        self.line_number, line, repr(match), len(self.parsing_details["values"]))
                     )
                 continue
 
             if match.lastindex != self.valuecount:
                 if not line.startswith('#') and not line.startswith(';') and not len(line) == 0:
                     self.logging.warning(
-                        "No Match - position {0}; contents: '{1}'; match: {2}; match-count: {4}; values: {3}".format(
-                            self.file.tell(), line, repr(match), len(self.parsing_details["values"]), match.lastindex
+                        "No Match - line {0}; contents: '{1}'; match: {2}; match-count: {4}; values: {3}".format(
+                            self.line_number, line, repr(match), len(self.parsing_details["values"]), match.lastindex
                         )
                     )
                 continue
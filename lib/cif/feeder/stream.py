@@ -0,0 +1,160 @@
+import gzip
+import hashlib
+import io
+import struct
+import tempfile
+import zipfile
+import zlib
+
+__author__ = 'James DeVincentis <james.d@hexhost.net>'
+
+CHUNK_SIZE = 1024 * 1024
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZIP_MAGIC = b'PK\x03\x04'
+
+# Bodies held in memory while they are hashed before parsing. Larger bodies go to a temporary file
+SPOOL_SIZE = 16 * 1024 * 1024
+
+
+class HashingReader(io.RawIOBase):
+    def __init__(self, fileobj):
+        """Computes the SHA256 of a binary stream while it is being read
+
+        :param fileobj: Binary file like object
+        """
+        io.RawIOBase.__init__(self)
+        self._fileobj = fileobj
+        self._hash = hashlib.sha256()
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._fileobj.read(len(buffer))
+        if not len(data):
+            self.eof = True
+            return 0
+        self._hash.update(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def hexdigest(self):
+        """Returns the hash of everything read so far
+
+        :return: SHA256 hex digest
+        :rtype: str
+        """
+        return self._hash.hexdigest()
+
+
+class ZipMemberReader(io.RawIOBase):
+    def __init__(self, fileobj):
+        """Decompresses the first member of a zip archive while it is being read. Unlike :py:mod:`zipfile` this only
+        needs the local file header, so the archive doesn't have to be seekable or complete.
+
+        :param fileobj: Binary file like object positioned at the start of the archive
+        :raises: ValueError
+        """
+        io.RawIOBase.__init__(self)
+        header = fileobj.read(30)
+        if len(header) != 30:
+            raise ValueError("Truncated zip header")
+        (signature, version, flags, method, mtime, mdate, crc, compressed_size, size, name_length,
+         extra_length) = struct.unpack('<4sHHHHHIIIHH', header)
+        if signature != ZIP_MAGIC:
+            raise ValueError("Not a zip archive")
+        if flags & 0x1:
+            raise ValueError("Encrypted zip archives are not supported")
+        fileobj.read(name_length + extra_length)
+
+        if method == zipfile.ZIP_DEFLATED:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            self._remaining = None
+        elif method == zipfile.ZIP_STORED and not flags & 0x8:
+            self._decompressor = None
+            self._remaining = compressed_size
+        else:
+            raise ValueError("Unsupported zip compression method {0}".format(method))
+
+        self._fileobj = fileobj
+        self._pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not len(self._pending):
+            if self._decompressor is None:
+                if not self._remaining:
+                    return 0
+                data = self._fileobj.read(min(CHUNK_SIZE, self._remaining))
+                if not len(data):
+                    return 0
+                self._remaining -= len(data)
+                self._pending = data
+            else:
+                if self._decompressor.eof:
+                    return 0
+                data = self._decompressor.unconsumed_tail
+                if not len(data):
+                    data = self._fileobj.read(CHUNK_SIZE)
+                    if not len(data):
+                        return 0
+                # Bound the output of every step so a highly compressed member can't balloon in memory
+                self._pending = self._decompressor.decompress(data, CHUNK_SIZE)
+
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def open_binary(fileobj):
+    """Decompresses a binary stream, like an HTTP response body or a local file, as it is read. gzip and zip content is
+    detected from its first bytes, anything else is passed through.
+
+    :param fileobj: Binary file like object
+    :return: Binary stream of the decompressed content
+    :rtype: io.BufferedIOBase
+    """
+    if not hasattr(fileobj, 'peek'):
+        fileobj = io.BufferedReader(fileobj, CHUNK_SIZE)
+
+    magic = fileobj.peek(4)[:4]
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    elif magic == ZIP_MAGIC:
+        return io.BufferedReader(ZipMemberReader(fileobj), CHUNK_SIZE)
+    return fileobj
+
+
+def open_text(fileobj, encoding="ISO8859-1"):
+    """Turns a binary stream into a text stream for the parsers. Compressed content is decompressed with
+    :py:func:`open_binary` as it is read, so parsing starts with the first bytes received and nothing is written to
+    disk.
+
+    :param fileobj: Binary file like object
+    :param str encoding: Encoding of the text
+    :return: Text stream
+    :rtype: io.TextIOWrapper
+    """
+    return io.TextIOWrapper(open_binary(fileobj), encoding=encoding)
+
+
+def spool(fileobj):
+    """Reads a binary stream to the end into memory, or a temporary file once it grows past `SPOOL_SIZE`
+
+    :param fileobj: Binary file like object
+    :return: Binary file like object positioned at the start of the data
+    :rtype: tempfile.SpooledTemporaryFile
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE, mode="w+b")
+    while True:
+        data = fileobj.read(CHUNK_SIZE)
+        if not len(data):
+            break
+        spooled.write(data)
+    spooled.seek(0)
+    return spooled
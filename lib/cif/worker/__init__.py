@@ -2,5 +2,6 @@ from . import meta
 from . import plugins
 
 from .worker import Process
+from .scaler import Scaler
 
 __author__ = 'James DeVincentis <james.d@hexhost.net>'
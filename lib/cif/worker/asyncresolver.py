@@ -0,0 +1,163 @@
+import asyncio
+import concurrent.futures
+import threading
+
+import dns.rdatatype
+import dns.resolver
+
+try:
+    import dns.asyncresolver
+    HAS_ASYNCRESOLVER = True
+except ImportError:
+    HAS_ASYNCRESOLVER = False
+
+import cif
+
+__author__ = 'James DeVincentis <james.d@hexhost.net>'
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+class Answer(object):
+    def __init__(self, records=None, ttl=None, nxdomain=False, error=False):
+        """
+        Result of a single DNS lookup
+
+        :param list records: List of (record type, record value) tuples from the answer section
+        :param ttl: Lowest TTL of the returned records or, for a negative answer, the negative caching TTL from the
+                    SOA record of the authority section
+        :type ttl: int or None
+        :param bool nxdomain: The name does not exist
+        :param bool error: The lookup failed or timed out
+        :return: None
+        """
+        self.records = records or []
+        self.ttl = ttl
+        self.nxdomain = nxdomain
+        self.error = error
+
+
+class AsyncResolver(object):
+    def __init__(self, concurrency=100, timeout=5):
+        """
+        Runs DNS lookups concurrently on an asyncio event loop living in its own thread. Uses dns.asyncresolver when
+        dnspython provides it, otherwise blocking lookups are run on an executor.
+
+        :param int concurrency: Maximum number of lookups in flight at once
+        :param int timeout: Seconds before a single lookup is abandoned
+        :return: None
+        """
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self._executor = None
+
+        if HAS_ASYNCRESOLVER:
+            self._resolver = dns.asyncresolver.Resolver()
+        else:
+            self._resolver = dns.resolver.Resolver()
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+        self._resolver.lifetime = timeout
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="AsyncResolver")
+        self._thread.daemon = True
+        self._thread.start()
+        self._semaphore = asyncio.run_coroutine_threadsafe(self._make_semaphore(), self._loop).result()
+
+    async def _make_semaphore(self):
+        return asyncio.Semaphore(self.concurrency)
+
+    def resolve_many(self, queries):
+        """
+        Looks up all queries concurrently and waits for every one of them to finish
+
+        :param queries: Iterable of (name, record type) tuples. Duplicates are only looked up once
+        :type queries: list[(str, str)]
+        :return: Dictionary mapping each (name, record type) tuple to an Answer
+        :rtype: dict
+        """
+        queries = list(set(queries))
+        if not len(queries):
+            return {}
+        return asyncio.run_coroutine_threadsafe(self._resolve_all(queries), self._loop).result()
+
+    def resolve(self, name, rdtype):
+        """
+        Looks up a single name
+
+        :param str name: Name to look up
+        :param str rdtype: Record type (A, TXT, ...)
+        :return: The answer to the lookup
+        :rtype: Answer
+        """
+        return self.resolve_many([(name, rdtype)])[(name, rdtype)]
+
+    async def _resolve_all(self, queries):
+        answers = await asyncio.gather(*[self._resolve_one(name, rdtype) for name, rdtype in queries])
+        return dict(zip(queries, answers))
+
+    async def _resolve_one(self, name, rdtype):
+        async with self._semaphore:
+            try:
+                if self._executor is None:
+                    answer = await asyncio.wait_for(self._resolver.resolve(name, rdtype), self.timeout)
+                else:
+                    query = getattr(self._resolver, "resolve", None) or self._resolver.query
+                    answer = await asyncio.wait_for(
+                        self._loop.run_in_executor(self._executor, query, name, rdtype), self.timeout
+                    )
+            except dns.resolver.NXDOMAIN as e:
+                responses = e.kwargs.get("responses") or {}
+                return Answer(ttl=_negative_ttl(list(responses.values())), nxdomain=True)
+            except dns.resolver.NoAnswer as e:
+                response = e.kwargs.get("response")
+                return Answer(ttl=_negative_ttl([response] if response is not None else []))
+            except Exception:
+                # Failures happen for various reasons (NoAnswer, timeouts, SERVFAIL...). Callers treat them as no data
+                return Answer(error=True)
+
+        records = []
+        ttl = None
+        for rrset in answer.response.answer:
+            if ttl is None or rrset.ttl < ttl:
+                ttl = rrset.ttl
+            for item in rrset:
+                records.append((dns.rdatatype.to_text(rrset.rdtype), str(item)))
+        return Answer(records=records, ttl=ttl)
+
+
+def _negative_ttl(responses):
+    """
+    Finds how long a negative answer may be cached (RFC 2308): the lower of the TTL of the SOA record in the authority
+    section and its minimum field
+
+    :param list[dns.message.Message] responses: Responses carrying the negative answer
+    :return: Negative caching TTL or None if no response has a SOA record
+    :rtype: int or None
+    """
+    ttl = None
+    for response in responses:
+        for rrset in response.authority:
+            if rrset.rdtype != dns.rdatatype.SOA:
+                continue
+            for item in rrset:
+                value = min(rrset.ttl, item.minimum)
+                if ttl is None or value < ttl:
+                    ttl = value
+    return ttl
+
+
+def get_resolver():
+    """
+    Returns the resolver shared by all threads of this worker process, creating it on first use
+
+    :return: Shared resolver
+    :rtype: AsyncResolver
+    """
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = AsyncResolver(concurrency=cif.options.worker_dns_concurrency,
+                                      timeout=cif.options.worker_dns_timeout)
+    return _resolver
@@ -3,10 +3,14 @@ import os
 __author__ = 'James DeVincentis <james.d@hexhost.net>'
 
 meta = {}
+# Meta processors that can also handle a whole list of observables at once
+meta_many = {}
 
 pluginfiles = os.listdir(os.path.dirname(__file__))
 for plugin in pluginfiles:
     if plugin.endswith('.py') and plugin != "__init__.py":
         module = __import__("cif.worker.meta.{0}".format(os.path.splitext(plugin)[0]), fromlist=["process"])
         meta[os.path.splitext(plugin)[0]] = module.process
+        if hasattr(module, "process_many"):
+            meta_many[os.path.splitext(plugin)[0]] = module.process_many
 del pluginfiles
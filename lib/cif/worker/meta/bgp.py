@@ -1,10 +1,192 @@
+import copy
 import ipaddress
+import os
+import threading
+import time
 
-import dns.resolver
 import dns.reversename
 
+import cif
+import cif.worker.asyncresolver
+import cif.cache
+
 __author__ = 'James DeVincentis <james.d@hexhost.net>'
 
+# Caches shared by all threads of a worker process. Origin/peer answers are cached by the prefix Team Cymru returns so
+# every address inside that prefix is answered from memory, ASN descriptions are cached by ASN.
+prefixes = None
+asns = None
+_cache_lock = threading.Lock()
+_cache_saved = time.time()
+
+
+def _caches():
+    """Creates the shared caches on first use, loading them from cif.CACHEDIR if persistence is enabled
+
+    :return: Tuple of the prefix cache and the ASN description cache
+    :rtype: tuple
+    """
+    global prefixes, asns
+    with _cache_lock:
+        if prefixes is None:
+            prefixes = cif.cache.PrefixCache(maxsize=cif.options.worker_bgp_cache_size,
+                                             ttl=cif.options.worker_bgp_cache_ttl)
+            asns = cif.cache.TTLCache(maxsize=cif.options.worker_bgp_cache_size,
+                                      ttl=cif.options.worker_bgp_cache_ttl)
+            if cif.options.worker_bgp_cache_persist:
+                cif.cache.load(os.path.join(cif.CACHEDIR, 'bgp-cache.pickle'),
+                               {"prefixes": prefixes, "asns": asns})
+    return prefixes, asns
+
+
+def _persist():
+    """Saves the shared caches to cif.CACHEDIR at most every 5 minutes if persistence is enabled
+
+    """
+    global _cache_saved
+    if not cif.options.worker_bgp_cache_persist:
+        return
+    with _cache_lock:
+        if time.time() - _cache_saved < 300:
+            return
+        _cache_saved = time.time()
+    try:
+        cif.cache.save(os.path.join(cif.CACHEDIR, 'bgp-cache.pickle'), {"prefixes": prefixes, "asns": asns})
+    except Exception:
+        cif.logging.getLogger('BGP').exception("Could not save BGP cache")
+
+
+def _fields(value):
+    return [x.strip() for x in value.strip('"').split('|')]
+
+
+def process_many(observables):
+    """Takes a list of observables and adds meta to them. This meta processor adds BGP data (ASN, Peers). Addresses in
+    a cached prefix are answered from memory, the remaining origin and peer lookups for the list are made concurrently,
+    followed by all uncached ASN description lookups.
+
+    :param list[cif.types.Observable] observables: Observables to add meta to
+    :return: The augmented observables
+    :rtype: list[cif.types.Observable]
+    """
+    (prefix_cache, asn_cache) = _caches()
+
+    # Index of observable -> prefix data: {"asn", "cc", "rir", "prefix"} plus "peer" for IPv4
+    found = {}
+    lookups = {}
+    for index, observable in enumerate(observables):
+        if observable is None or observable.otype not in ["ipv4", "ipv6"]:
+            continue
+
+        if observable.otype == "ipv4":
+            ip = ipaddress.IPv4Interface(observable.observable).ip
+            reverse = str(dns.reversename.from_address(str(ip))).replace(".in-addr.arpa.", "")
+            asn_lookup = reverse + ".origin.asn.cymru.com"
+            peer_lookup = reverse + ".peer.asn.cymru.com"
+        else:
+            ip = ipaddress.IPv6Interface(observable.observable).ip
+            asn_lookup = str(dns.reversename.from_address(str(ip))).replace(".ip6.arpa.", "") + ".origin6.asn.cymru.com"
+            peer_lookup = None
+
+        if ip.is_private:
+            continue
+
+        cached = prefix_cache.lookup(ip)
+        if cached is not None:
+            found[index] = copy.deepcopy(cached)
+            continue
+
+        lookups[index] = (asn_lookup, peer_lookup)
+
+    resolver = cif.worker.asyncresolver.get_resolver()
+
+    queries = []
+    for asn_lookup, peer_lookup in lookups.values():
+        queries.append((asn_lookup, 'TXT'))
+        if peer_lookup is not None:
+            queries.append((peer_lookup, 'TXT'))
+    answers = resolver.resolve_many(queries)
+
+    for index, (asn_lookup, peer_lookup) in lookups.items():
+        data = {"asn": None, "cc": None, "rir": None, "prefix": None}
+        for record_type, value in answers[(asn_lookup, 'TXT')].records:
+            try:
+                (asn, prefix, cc, rir, date) = _fields(value)
+            except ValueError:
+                continue
+            try:
+                data["asn"] = int(asn)
+            except:
+                pass
+            data["cc"] = cc
+            data["rir"] = rir
+            data["prefix"] = prefix
+
+        if peer_lookup is not None:
+            data["peer"] = None
+            for record_type, value in answers[(peer_lookup, 'TXT')].records:
+                tmp = _fields(value)
+                if len(tmp) < 5:
+                    continue
+                if len(tmp[4]) == 0:
+                    tmp[4] = None
+                data["peer"] = {"asn": tmp[0].split(" ")[0], "cc": tmp[2], "prefix": tmp[1], "rir": tmp[3],
+                                "date": tmp[4]}
+
+        if data["prefix"] is not None:
+            try:
+                prefix_cache.insert(data["prefix"], copy.deepcopy(data))
+            except ValueError:
+                pass
+
+        found[index] = data
+
+    # ASN descriptions depend on the answers above, so uncached ones are looked up in a second round
+    descriptions = {}
+    for data in found.values():
+        for asn in [data["asn"], data["peer"]["asn"] if data.get("peer") is not None else None]:
+            if asn is not None and asn not in descriptions:
+                descriptions[asn] = asn_cache.get(str(asn))
+
+    answers = resolver.resolve_many([("AS{0}.asn.cymru.com".format(asn), 'TXT') for asn, description in
+                                     descriptions.items() if description is None])
+
+    for asn, description in descriptions.items():
+        if description is not None:
+            continue
+        answer = answers[("AS{0}.asn.cymru.com".format(asn), 'TXT')]
+        for record_type, value in answer.records:
+            try:
+                descriptions[asn] = _fields(value)[4]
+            except IndexError:
+                pass
+        if descriptions[asn] is not None:
+            asn_cache.set(str(asn), descriptions[asn])
+
+    for index, data in found.items():
+        observable = observables[index]
+        if data["asn"] is not None:
+            observable.asn = data["asn"]
+            if descriptions.get(data["asn"]) is not None:
+                observable.asn_desc = descriptions[data["asn"]]
+        if data["prefix"] is not None:
+            observable.cc = data["cc"]
+            observable.rir = data["rir"]
+            observable.prefix = data["prefix"]
+
+        if "peer" in data:
+            peer = data["peer"]
+            if peer is not None:
+                if descriptions.get(peer["asn"]) is not None:
+                    peer["asn_description"] = descriptions[peer["asn"]]
+                observable.peers = [peer]
+            else:
+                observable.peers = []
+
+    _persist()
+
+    return observables
+
 
 def process(observable=None):
     """Takes an observable and adds meta to it. This meta processor adds BGP data (ASN, Peers)
@@ -16,64 +198,4 @@ def process(observable=None):
     if observable is None:
         return observable
 
-    if observable.otype not in ["ipv4", "ipv6"]:
-        return observable
-
-    if observable.otype == "ipv4":
-        ip = ipaddress.IPv4Interface(observable.observable).ip
-        asn_lookup = str(dns.reversename.from_address(str(ip))).replace(".in-addr.arpa.", "") + ".origin.asn.cymru.com"
-        peer_lookup = str(dns.reversename.from_address(str(ip))).replace(".in-addr.arpa.", "") + ".peer.asn.cymru.com"
-
-    else:
-        ip = ipaddress.IPv6Interface(observable.observable).ip
-        asn_lookup = str(dns.reversename.from_address(str(ip))).replace(".ip6.arpa.", "") + ".origin6.asn.cymru.com"
-        peer_lookup = None
-
-    if ip.is_private:
-        return observable
-
-    try:
-        for record in dns.resolver.query(asn_lookup, 'TXT').response.answer:
-            for item in record:
-                (asn, prefix, cc, rir, date) = [x.strip() for x in str(item).strip('"').split('|')]
-                try:
-                    observable.asn = int(asn)
-                except:
-                    pass
-                observable.cc = cc
-                observable.rir = rir
-                observable.prefix = prefix
-    except:
-        pass
-
-    if observable.asn is not None:
-        try:
-            for record in dns.resolver.query("AS{0}.asn.cymru.com".format(observable.asn), 'TXT').response.answer:
-                for item in record:
-                    observable.asn_desc = [x.strip() for x in str(item).strip('"').split('|')][4]
-        except:
-            pass
-
-    if peer_lookup is not None:
-        peers = []
-        peer = None
-        try:
-            for record in dns.resolver.query(peer_lookup, 'TXT').response.answer:
-                for item in record:
-                    tmp = [x.strip() for x in str(item).strip('"').split('|')]
-                    if len(tmp[4]) == 0:
-                        tmp[4] = None
-                    peer = {"asn": tmp[0].split(" ")[0], "cc": tmp[2], "prefix": tmp[1], "rir": tmp[3], "date": tmp[4]}
-        except:
-            pass
-        try:
-            for asn in dns.resolver.query("AS{0}.asn.cymru.com".format(peer["asn"]), 'TXT').response.answer:
-                for asn_item in asn:
-                    peer["asn_description"] = [x.strip() for x in str(asn_item).strip('"').split('|')][4]
-        except:
-            pass
-        if peer is not None:
-            peers.append(peer)
-        observable.peers = peers
-
-    return observable
+    return process_many([observable])[0]
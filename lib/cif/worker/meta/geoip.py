@@ -1,12 +1,113 @@
 import ipaddress
 import os
+import threading
 
-import pygeoip
+try:
+    import maxminddb
+except ImportError:
+    maxminddb = None
+
+try:
+    import pygeoip
+except ImportError:
+    pygeoip = None
 
 import cif
 
 __author__ = 'James DeVincentis <james.d@hexhost.net>'
 
+_load_lock = threading.Lock()
+
+
+def _load():
+    """Opens the GeoIP database once per process. A GeoLite2 (MMDB) database is preferred and memory-mapped so every
+    worker process shares the same pages. The legacy GeoLiteCity.dat database is used when no MMDB database exists.
+
+    :return: The open database or False if none is available
+    """
+    with _load_lock:
+        if cif.GEODATA is None:
+            mmdb = os.path.join(cif.LIBDIR, 'GeoIP', 'GeoLite2-City.mmdb')
+            legacy = os.path.join(cif.LIBDIR, 'GeoIP', 'GeoLiteCity.dat')
+            if maxminddb is not None and os.path.exists(mmdb):
+                cif.GEODATA = maxminddb.open_database(mmdb, maxminddb.MODE_MMAP)
+            elif pygeoip is not None and os.path.exists(legacy):
+                cif.GEODATA = pygeoip.GeoIP(legacy, flags=pygeoip.MMAP_CACHE)
+            else:
+                cif.GEODATA = False
+    return cif.GEODATA
+
+
+def _record(geodata, ip):
+    """Looks up an address and returns the fields used for meta in the legacy GeoIP record format
+
+    :param geodata: Open database returned by _load()
+    :param ip: Address to look up
+    :type ip: ipaddress.IPv4Address or ipaddress.IPv6Address
+    :return: Record or None if the address was not found
+    :rtype: dict or None
+    """
+    if pygeoip is not None and isinstance(geodata, pygeoip.GeoIP):
+        if ip.version != 4:
+            return None
+        return geodata.record_by_addr(str(ip))
+
+    record = geodata.get(str(ip))
+    if not isinstance(record, dict):
+        return None
+
+    location = record.get("location", {})
+    subdivisions = record.get("subdivisions", [{}])
+    return {
+        "country_code": record.get("country", {}).get("iso_code"),
+        "city": record.get("city", {}).get("names", {}).get("en"),
+        "region_code": subdivisions[0].get("iso_code") if len(subdivisions) else None,
+        "latitude": location.get("latitude"),
+        "longitude": location.get("longitude"),
+        "time_zone": location.get("time_zone"),
+        "metro_code": location.get("metro_code")
+    }
+
+
+def process_many(observables):
+    """Takes a list of observables and adds meta to them. This meta processor adds GeoIP data for IPv4 and IPv6
+    observables
+
+    :param list[cif.types.Observable] observables: Observables to add meta to
+    :return: The augmented observables
+    :rtype: list[cif.types.Observable]
+    """
+    geodata = None
+    for observable in observables:
+        if observable is None or observable.otype not in ["ipv4", "ipv6"]:
+            continue
+
+        ip = ipaddress.ip_interface(observable.observable).ip
+        if ip.is_private:
+            continue
+
+        if geodata is None:
+            geodata = _load()
+        if not geodata:
+            return observables
+
+        record = _record(geodata, ip)
+        if isinstance(record, dict):
+            # Records may lack any of these, only set what is there so meta from other processors is kept
+            if record.get("country_code") is not None:
+                observable.cc = record['country_code']
+            if record.get("city") is not None and record.get("region_code") is not None:
+                observable.citycode = record['city'] + ", " + record['region_code']
+            if record.get("latitude") is not None and record.get("longitude") is not None:
+                observable.latitude = record['latitude']
+                observable.longitude = record['longitude']
+                observable.geolocation = "{0}, {1}".format(record['latitude'], record['longitude'])
+            if record.get("time_zone") is not None:
+                observable.timezone = record['time_zone']
+            if record.get("metro_code") is not None:
+                observable.metrocode = record['metro_code']
+    return observables
+
 
 def process(observable=None):
     """Takes an observable and adds meta to it. This meta processor adds GeoIP data
@@ -19,30 +120,4 @@ def process(observable=None):
     if observable is None:
         return observable
 
-    if observable.otype not in ["ipv4"]:
-        return observable
-
-    if ipaddress.IPv4Interface(observable.observable).ip.is_private:
-        return observable
-
-    if cif.GEODATA is None:
-        geodata = os.path.join(cif.LIBDIR, 'GeoIP', 'GeoLiteCity.dat')
-        if os.path.exists(geodata):
-            cif.GEODATA = pygeoip.GeoIP(geodata, flags=pygeoip.MEMORY_CACHE)
-        else:
-            cif.GEODATA = False
-            return observable
-    elif not cif.GEODATA:
-        return observable
-
-    record = cif.GEODATA.record_by_addr(str(ipaddress.IPv4Interface(observable.observable).ip))
-    if isinstance(record, dict):
-        observable.cc = record['country_code']
-        if record["city"] is not None and record["region_code"] is not None:
-            observable.citycode = record['city'] + ", " + record['region_code']
-        observable.latitude = record['latitude']
-        observable.longitude = record['longitude']
-        observable.timezone = record['time_zone']
-        observable.metrocode = record['metro_code']
-        observable.geolocation = "{0}, {1}".format(record['latitude'], record['longitude'])
-    return observable
+    return process_many([observable])[0]
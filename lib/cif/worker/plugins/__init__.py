@@ -4,12 +4,15 @@ CIF.Worker.Plugins
 Plugins take in an observable and may or may not generate additional observables based on data from the original
 observable.
 The additional observables should reference the original observable's ID using the 'related' field.
+Plugins may also provide process_many() which takes a list of observables and returns a list of results in the same
+order. Workers use it to handle a window of messages at once.
 """
 
 __package__ = 'cif.worker.plugins'
 __author__ = 'James DeVincentis <james.d@hexhost.net>'
 
 plugins = {}
+plugins_many = {}
 
 plugindir = os.path.dirname(__file__)
 pluginfiles = os.listdir(plugindir)
@@ -17,3 +20,5 @@ for plugin in pluginfiles:
     if plugin.endswith('.py') and plugin != "__init__.py":
         module = __import__("cif.worker.plugins.{0}".format(os.path.splitext(plugin)[0]), fromlist=["process"])
         plugins[os.path.splitext(plugin)[0]] = module.process
+        if hasattr(module, "process_many"):
+            plugins_many[os.path.splitext(plugin)[0]] = module.process_many
@@ -1,12 +1,41 @@
 import datetime
 
-import dns.resolver
-
 import cif.types
+import cif.worker.asyncresolver
 
 __author__ = 'James DeVincentis <james.d@hexhost.net>'
 
 
+def process_many(observables):
+    """Takes a list of observables and creates new observables from data relating to each of them. The A, NS and MX
+    lookups for every observable in the list are made concurrently.
+
+    :param list[cif.types.Observable] observables: Observables to source data from
+    :return: A list containing, for each observable, a list of new observables related to it or None
+    :rtype: list
+    """
+    types = ['A', 'NS', 'MX']
+    queries = []
+    for observable in observables:
+        if observable is None or observable.otype != "fqdn" or observable.confidence < 25:
+            continue
+        for recordtype in types:
+            queries.append((observable.observable, recordtype))
+
+    answers = cif.worker.asyncresolver.get_resolver().resolve_many(queries)
+
+    results = []
+    for observable in observables:
+        if observable is None or observable.otype != "fqdn" or observable.confidence < 25:
+            results.append(None)
+            continue
+        records = []
+        for recordtype in types:
+            records += answers[(observable.observable, recordtype)].records
+        results.append(_create(observable, records))
+    return results
+
+
 def process(observable=None):
     """Takes an observable and creates new observables from data relating to the specified observable
 
@@ -18,28 +47,23 @@ def process(observable=None):
     if observable is None:
         return None
 
-    if observable.otype != "fqdn":
-        return None
+    return process_many([observable])[0]
 
-    if observable.confidence < 25:
-        return None
 
+def _create(observable, records):
+    """Creates new observables from the DNS records found for `observable`
+
+    :param cif.types.Observable observable: Observable the records were looked up for
+    :param list records: List of (record type, record value) tuples
+    :return: A list of new observables related to the incoming one
+    :rtype: list
+    """
     newobservables = []
     confidence = cif.types.Observable.degrade_confidence(observable)
     tags = set(observable.tags)
     tags.add("rdata")
-    types = ['A', 'NS', 'MX']
-    records = []
-    for recordtype in types:
-        try:
-            for record in dns.resolver.query(observable.observable, recordtype).response.answer:
-                if record is not None:
-                    records += str(record).split("\n")
-        except:
-            continue
 
-    for record in records:
-        (hostname, ttl, record_class, record_type, record_value) = record.split(" ", 4)
+    for record_type, record_value in records:
         if record_type == "A":
             newobservable = record_value
             application = None
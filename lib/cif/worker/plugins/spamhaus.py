@@ -1,9 +1,14 @@
 import datetime
 import ipaddress
+import threading
+import time
 
-import dns
+import dns.reversename
 
+import cif
 import cif.types
+import cif.worker.asyncresolver
+import cif.cache
 
 __author__ = 'James DeVincentis <james.d@hexhost.net>'
 
@@ -58,13 +63,36 @@ for i in range(4, 19):
 for i in range(20, 39):
     codes['fqdn']["127.0.1.{0}".format(i)] = {"assessment": "malware", "description": ''}
 
+# Answers shared by all threads of a worker process, keyed on the lookup name. Listed indicators store their return
+# codes for the record TTL, unlisted ones (NXDOMAIN) store an empty list for --worker-spamhaus-negative-ttl.
+cache = None
+_cache_lock = threading.Lock()
+_cache_logged = time.time()
 
-def process(observable=None):
-    """Takes an observable and creates new observables from data relating to the specified observable
 
-    :param cif.types.Ipaddress observable: Observable to source data from
-    :return: A list of new observables related to the incoming one
-    :rtype: cif.types.Observable
+def _cache():
+    """Creates the shared cache on first use and logs its counters every 5 minutes
+
+    :return: The shared cache
+    :rtype: cif.cache.TTLCache
+    """
+    global cache, _cache_logged
+    with _cache_lock:
+        if cache is None:
+            cache = cif.cache.TTLCache(maxsize=cif.options.worker_spamhaus_cache_size,
+                                       ttl=cif.options.worker_spamhaus_negative_ttl)
+        elif time.time() - _cache_logged >= 300:
+            _cache_logged = time.time()
+            cif.logging.getLogger('SPAMHAUS').info("Cache stats: {0}".format(cache.stats()))
+    return cache
+
+
+def _lookup(observable):
+    """Builds the DNSBL lookup name and the reference url for an observable
+
+    :param cif.types.Observable observable: Observable to check
+    :return: Tuple of the lookup name and altid or None if the observable is not checked
+    :rtype: tuple or None
     """
     if observable is None:
         return None
@@ -72,9 +100,6 @@ def process(observable=None):
     if observable.provider is not None and observable.provider == provider:
         return None
 
-    if observable.otype != "fqdn" and observable.otype != "ipv4":
-        return None
-
     if observable.otype == "ipv4":
 
         ip = ipaddress.IPv4Interface(observable.observable).ip
@@ -94,41 +119,84 @@ def process(observable=None):
 
         return None
 
-    newobservables = []
-    records = []
-    try:
-        for record in dns.resolver.query(lookup, 'A').response.answer:
-            if record is not None:
-                records += str(record).split("\n")
+    return lookup, altid
 
-    except:
-        # Failures will be ignored. Failures happen for various reasons.
-        pass
 
-    for record in records:
-        (hostname, ttl, record_class, record_type, record_value) = record.split(" ", 4)
+def process_many(observables):
+    """Takes a list of observables and creates new observables from data relating to each of them. The DNSBL lookups
+    for every observable in the list are made concurrently.
 
-        if record_value not in codes[observable.otype]:
+    :param list[cif.types.Observable] observables: Observables to source data from
+    :return: A list containing, for each observable, a list of new observables related to it or None
+    :rtype: list
+    """
+    lookups = [_lookup(observable) for observable in observables]
+
+    shared = _cache()
+    answers = {}
+    for lookup in lookups:
+        if lookup is not None and lookup[0] not in answers:
+            answers[lookup[0]] = shared.get(lookup[0])
+
+    resolved = cif.worker.asyncresolver.get_resolver().resolve_many(
+        [(name, 'A') for name, values in answers.items() if values is None]
+    )
+    for (name, record_type), answer in resolved.items():
+        answers[name] = [record_value for record_type, record_value in answer.records if record_type == "A"]
+        # Failed lookups are not cached so they are retried next time
+        if answer.error:
+            continue
+        if len(answers[name]) and answer.ttl is not None:
+            shared.set(name, answers[name], ttl=answer.ttl)
+        elif answer.ttl is not None:
+            # Unlisted answers are kept as long as the zone's SOA allows, up to --worker-spamhaus-negative-ttl
+            shared.set(name, answers[name], ttl=min(answer.ttl, cif.options.worker_spamhaus_negative_ttl))
+        else:
+            shared.set(name, answers[name])
+
+    results = []
+    for observable, lookup in zip(observables, lookups):
+        if lookup is None:
+            results.append(None)
             continue
 
-        newobservables.append(cif.types.Observable(
-            {
-                "observable": observable.observable,
-                "portlist": observable.portlist,
-                "protocol": observable.protocol,
-                "tags": [codes[observable.otype][record_value]["assessment"]],
-                "description": codes[observable.otype][record_value]["description"],
-                "tlp": observable.tlp,
-                "group": observable.group,
-                "provider": provider,
-                "confidence": confidence,
-                "application": observable.application,
-                "altid": altid,
-                "altid_tlp": "green",
-                "related": observable.id,
-                "lasttime": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
-                "reporttime": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-            }
-        ))
-
-    return newobservables
+        newobservables = []
+        for record_value in answers[lookup[0]]:
+            if record_value not in codes[observable.otype]:
+                continue
+
+            newobservables.append(cif.types.Observable(
+                {
+                    "observable": observable.observable,
+                    "portlist": observable.portlist,
+                    "protocol": observable.protocol,
+                    "tags": [codes[observable.otype][record_value]["assessment"]],
+                    "description": codes[observable.otype][record_value]["description"],
+                    "tlp": observable.tlp,
+                    "group": observable.group,
+                    "provider": provider,
+                    "confidence": confidence,
+                    "application": observable.application,
+                    "altid": lookup[1],
+                    "altid_tlp": "green",
+                    "related": observable.id,
+                    "lasttime": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "reporttime": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+                }
+            ))
+        results.append(newobservables)
+
+    return results
+
+
+def process(observable=None):
+    """Takes an observable and creates new observables from data relating to the specified observable
+
+    :param cif.types.Ipaddress observable: Observable to source data from
+    :return: A list of new observables related to the incoming one
+    :rtype: cif.types.Observable
+    """
+    if observable is None:
+        return None
+
+    return process_many([observable])[0]
@@ -0,0 +1,76 @@
+import time
+
+__author__ = 'James DeVincentis <james.d@hexhost.net>'
+
+
+class Scaler(object):
+    def __init__(self, workers_min, workers_max, threads_min, threads_max, high, low, cooldown):
+        """
+        Decides how many worker processes and threads per worker to run based on the depth of the work queue
+
+        :param int workers_min: Number of worker processes to never go below
+        :param int workers_max: Number of worker processes to never go above
+        :param int threads_min: Number of threads per worker to never go below
+        :param int threads_max: Number of threads per worker to never go above
+        :param int high: Queue depth above which capacity is added
+        :param int low: Queue depth below which capacity is removed
+        :param int cooldown: Seconds to wait after a change before changing again
+        :return: None
+        """
+        self.workers_min = workers_min
+        self.workers_max = max(workers_min, workers_max)
+        self.threads_min = threads_min
+        self.threads_max = max(threads_min, threads_max)
+        self.threads_step = max(1, threads_min)
+        self.high = high
+        self.low = low
+        self.cooldown = cooldown
+        self.workers = workers_min
+        self.threads = threads_min
+        self.rate = None
+        self._last_change = time.time()
+        self._last_depth = None
+        self._last_check = None
+
+    def update(self, depth):
+        """
+        Records the current queue depth and adjusts :py:attr:`workers` and :py:attr:`threads`. Threads are added before
+        processes when scaling up and processes are removed before threads when scaling down.
+
+        :param int depth: Number of messages waiting in the work queue
+        :return: True if the targets changed
+        :rtype: bool
+        """
+        now = time.time()
+
+        # Messages drained per second since the last check. Negative when the queue is growing
+        if self._last_depth is not None and now > self._last_check:
+            self.rate = (self._last_depth - depth) / (now - self._last_check)
+        self._last_depth = depth
+        self._last_check = now
+
+        if now - self._last_change < self.cooldown:
+            return False
+
+        if depth > self.high:
+            # Leave things alone if the current capacity will drain the queue before the next chance to scale
+            if self.rate is not None and self.rate > 0 and depth / self.rate < self.cooldown:
+                return False
+            if self.threads < self.threads_max:
+                self.threads = min(self.threads_max, self.threads + self.threads_step)
+            elif self.workers < self.workers_max:
+                self.workers += 1
+            else:
+                return False
+        elif depth < self.low:
+            if self.workers > self.workers_min:
+                self.workers -= 1
+            elif self.threads > self.threads_min:
+                self.threads = max(self.threads_min, self.threads - self.threads_step)
+            else:
+                return False
+        else:
+            return False
+
+        self._last_change = now
+        return True
@@ -27,6 +27,11 @@ class Thread(threading.Thread):
         self.logging = cif.logging.getLogger("THREAD #{0}-{1}".format(worker, name))
         self._mq_connection = None
         self._mq_channel = None
+        self._batch = []
+        self._batch_count = 0
+        self._batch_bytes = 0
+        self._batch_started = None
+        self._stopping = False
 
     def run(self):
         """
@@ -42,7 +47,7 @@ class Thread(threading.Thread):
         self._backend = getattr(self._backend, cif.options.storage.title())()
         self.logging.debug("Connecting to Backend {0}".format(cif.options.storage_uri))
 
-        self._backend.connect(cif.options.storage_uri)
+        self._backend.connect(cif.options.storage_uri, timeout=cif.options.storage_timeout)
         self.logging.debug("Connected to Backend {0}".format(cif.options.storage_uri))
 
         self._mq_connection = pika.BlockingConnection(
@@ -52,14 +57,67 @@ class Thread(threading.Thread):
         self._mq_channel = self._mq_connection.channel()
         self._mq_channel.queue_declare(cif.options.mq_work_queue_name, durable=True)
         self._mq_channel.exchange_declare(exchange=cif.options.mq_observable_exchange_name, type='fanout')
-        self._mq_channel.basic_qos(prefetch_count=2)
-        self._mq_channel.basic_consume(self.process, cif.options.mq_work_queue_name)
+        self._mq_channel.basic_qos(prefetch_count=cif.options.worker_prefetch)
         try:
-            self._mq_channel.start_consuming()
+            if cif.options.worker_consume_mode == "window":
+                self._consume_window()
+            else:
+                self._mq_channel.basic_consume(self.process, cif.options.mq_work_queue_name)
+                self._mq_connection.add_timeout(1, self._tick)
+                self._mq_channel.start_consuming()
         except KeyboardInterrupt:
             self._mq_channel.stop_consuming()
+        self.flush()
         self._mq_channel.close()
 
+    def _consume_window(self):
+        """
+        Pulls up to --worker-window messages off the queue and processes them together. A window is processed early
+        when the queue goes idle or its oldest message has waited --worker-batch-age seconds.
+
+        :return: None
+        """
+        messages = []
+        window_started = None
+        for message in self._mq_channel.consume(cif.options.mq_work_queue_name, inactivity_timeout=1):
+            # Depending on the pika version inactivity yields None or a tuple of Nones
+            if message is not None and message[0] is not None:
+                (method_frame, header_frame, body) = message
+                if window_started is None:
+                    window_started = time.time()
+                messages.append((method_frame, body))
+
+            if len(messages) and (len(messages) >= cif.options.worker_window or message is None or
+                                  message[0] is None or
+                                  time.time() - window_started >= cif.options.worker_batch_age):
+                self.process_window(messages)
+                messages = []
+                window_started = None
+
+            if self._batch_started is not None and time.time() - self._batch_started >= cif.options.worker_batch_age:
+                self.flush()
+
+            if self._stopping:
+                break
+
+        if len(messages):
+            self.process_window(messages)
+        self.flush()
+        self._mq_channel.cancel()
+
+    def _tick(self):
+        """
+        Flushes the batch once it is older than the configured maximum age and reschedules itself
+
+        :return: None
+        """
+        if self._batch_started is not None and time.time() - self._batch_started >= cif.options.worker_batch_age:
+            self.flush()
+        if self._stopping:
+            self._mq_channel.stop_consuming()
+            return
+        self._mq_connection.add_timeout(1, self._tick)
+
     def process(self, channel, method_frame, header_frame, body):
         """
         Processes an incoming RabbitMQ message containing a JSON encoded observable
@@ -74,72 +132,190 @@ class Thread(threading.Thread):
         :type body: bytearray
         :return: None
         """
-        try:
-            observable = cif.types.Observable(json.loads(body.decode("utf-8")))
-        except:
-            if not method_frame.redelivered:
-                channel.basic_nack(delivery_tag=method_frame.delivery_tag)
-            else:
-                channel.basic_ack(delivery_tag=method_frame.delivery_tag)
-            self.logging.exception("Couldn't process message '{0}'".format(json.loads(body.decode("utf-8"))))
-            return
-        
-        # If the observable has no otype by now, drop it
-        if observable.otype is None:
-            self.logging.warning("Dropping Observable due to unknown type: '{0}'".format(observable.observable))
-            channel.basic_ack(delivery_tag=method_frame.delivery_tag)
+        self.process_window([(method_frame, body)])
+
+    def process_window(self, messages):
+        """
+        Processes a list of RabbitMQ messages containing JSON encoded observables as one batch through meta, plugins
+        and the backend. Every message is still acknowledged or rejected on its own.
+
+        :param messages: List of tuples containing the delivery frame and the message body
+        :type messages: list[(pika.spec.Basic.Deliver, bytearray)]
+        :return: None
+        """
+        deliveries = []
+        for method_frame, body in messages:
+            try:
+                observable = cif.types.Observable(json.loads(body.decode("utf-8")))
+            except:
+                self._reject(method_frame, body)
+                continue
+
+            # If the observable has no otype by now, drop it
+            if observable.otype is None:
+                self.logging.warning("Dropping Observable due to unknown type: '{0}'".format(observable.observable))
+                self._mq_channel.basic_ack(delivery_tag=method_frame.delivery_tag)
+                continue
+
+            deliveries.append((method_frame, body, observable))
+
+        if not len(deliveries):
             return
-        
+
+        try:
+            enriched = self._enrich([observable for method_frame, body, observable in deliveries])
+        except Exception:
+            if len(deliveries) == 1:
+                self._reject(deliveries[0][0], deliveries[0][1])
+                return
+            # Go through the window one message at a time so a bad observable only costs its own delivery
+            self.logging.warning("Processing a window of {0} messages failed. Retrying them one at a time.".format(
+                len(deliveries))
+            )
+            retried = []
+            enriched = []
+            for method_frame, body, observable in deliveries:
+                try:
+                    enriched.extend(self._enrich([cif.types.Observable(json.loads(body.decode("utf-8")))]))
+                except Exception:
+                    self._reject(method_frame, body)
+                    continue
+                retried.append((method_frame, body, observable))
+            deliveries = retried
+
+        for index, (method_frame, body, observable) in enumerate(deliveries):
+            self.logging.debug("Adding {0} observables to the batch.".format(len(enriched[index])))
+
+            if self._batch_started is None:
+                self._batch_started = time.time()
+            self._batch.append((method_frame, enriched[index]))
+            self._batch_count += len(enriched[index])
+            self._batch_bytes += len(body)
+
+            if self._batch_count >= cif.options.worker_batch_size or \
+                    self._batch_bytes >= cif.options.worker_batch_bytes:
+                self.flush()
+
+    def _reject(self, method_frame, body):
+        """
+        Rejects a message that couldn't be processed. It is requeued once and dropped if it fails again.
+
+        :param pika.spec.Basic.Deliver method_frame: Delivery frame of the message
+        :param bytearray body: The message
+        :return: None
+        """
+        if not method_frame.redelivered:
+            self._mq_channel.basic_nack(delivery_tag=method_frame.delivery_tag)
+        else:
+            self._mq_channel.basic_ack(delivery_tag=method_frame.delivery_tag)
+        self.logging.exception("Couldn't process message '{0}'".format(body))
+
+    def _enrich(self, observables):
+        """
+        Runs meta and plugins over a list of observables
+
+        :param list[cif.types.Observable] observables: Observables to process
+        :return: For every observable a list holding it followed by the new observables plugins created from it
+        :rtype: list[list[cif.types.Observable]]
+        """
         # Fetch Meta
-        for name, meta in cif.worker.meta.meta.items():
-            self.logging.debug("Fetching meta using: {0}".format(name))
-            observable = meta(observable=observable)
+        observables = self._fetch_meta(observables)
 
-        newobservables = []
+        newobservables = [[] for observable in observables]
 
         for name, plugin in cif.worker.plugins.plugins.items():
-            self.logging.debug("Running plugin: {0}".format(name))
-            result = plugin(observable=observable)
-            if result is not None:
-                for newobservable in result:
-                    newobservables.append(newobservable)
+            self.logging.debug("Running plugin: {0} for {1} observables".format(name, len(observables)))
+            if name in cif.worker.plugins.plugins_many:
+                results = cif.worker.plugins.plugins_many[name](observables)
+            else:
+                results = [plugin(observable=observable) for observable in observables]
+            for index, result in enumerate(results):
+                if result is not None:
+                    for newobservable in result:
+                        newobservables[index].append(newobservable)
+
+        # Fetch meta for all of the new observables at once and then hand them back to the observable they came from
+        flattened = self._fetch_meta([o for related in newobservables for o in related])
+        for related in newobservables:
+            related[:] = flattened[:len(related)]
+            flattened = flattened[len(related):]
 
+        for index, observable in enumerate(observables):
+            newobservables[index].insert(0, observable)
+        return newobservables
+
+    def _fetch_meta(self, observables):
+        """
+        Runs every meta processor over a list of observables
+
+        :param list[cif.types.Observable] observables: Observables to add meta to
+        :return: The augmented observables
+        :rtype: list[cif.types.Observable]
+        """
+        if not len(observables):
+            return observables
         for name, meta in cif.worker.meta.meta.items():
-            for key, o in enumerate(newobservables):
-                self.logging.debug("Fetching meta using: {0} for new observable: {1}".format(name, key))
-                newobservables[key] = meta(observable=o)
+            self.logging.debug("Fetching meta using: {0} for {1} observables".format(name, len(observables)))
+            if name in cif.worker.meta.meta_many:
+                observables = cif.worker.meta.meta_many[name](observables)
+            else:
+                observables = [meta(observable=observable) for observable in observables]
+        return observables
 
-        newobservables.insert(0, observable)
-        self.logging.debug("Sending {0} observables to be created.".format(len(newobservables)))
+    def flush(self):
+        """
+        Sends all batched observables to the backend in a single bulk request. The deliveries they came from are only
+        acknowledged once the backend accepted them.
 
+        :return: None
+        """
+        if not len(self._batch):
+            return
+
+        batch = self._batch
+        observables = [observable for method_frame, newobservables in batch for observable in newobservables]
+        self._batch = []
+        self._batch_count = 0
+        self._batch_bytes = 0
+        self._batch_started = None
+
+        self.logging.debug("Sending {0} observables from {1} messages to be created.".format(len(observables),
+                                                                                           len(batch)))
         try:
-            self._backend.observable_create(newobservables)
-            channel.basic_ack(delivery_tag=method_frame.delivery_tag)
+            self._backend.observable_create(observables)
         except:
-            if not method_frame.redelivered:
-                channel.basic_nack(delivery_tag=method_frame.delivery_tag)
-            else:
-                channel.basic_ack(delivery_tag=method_frame.delivery_tag)
+            self.logging.exception("Couldn't create {0} observables".format(len(observables)))
+            for method_frame, newobservables in batch:
+                if not method_frame.redelivered:
+                    self._mq_channel.basic_nack(delivery_tag=method_frame.delivery_tag)
+                else:
+                    self._mq_channel.basic_ack(delivery_tag=method_frame.delivery_tag)
+            return
+
+        for method_frame, newobservables in batch:
+            self._mq_channel.basic_ack(delivery_tag=method_frame.delivery_tag)
 
-        for observable in newobservables:
+        for observable in observables:
             self._mq_channel.basic_publish(cif.options.mq_observable_exchange_name, '', json.dumps(observable.todict()))
 
     def stop(self):
         """
-        Stops the proceessing of messages
+        Stops the proceessing of messages. The consuming loop notices within a second, flushes its batch and exits.
 
         :return:
         """
-        self._mq_channel.stop_consuming()
+        self._stopping = True
 
 
 class Process(multiprocessing.Process):
-    def __init__(self, name):
+    def __init__(self, name, threads=None):
         """
         Initialize a worker process and get ready to spawn threads
 
         :param name: ID of this worker
         :type name: str
+        :param threads: Number of threads to run. Shared with the controller so it can be changed while running
+        :type threads: int or None
         :return: None
         """
         multiprocessing.Process.__init__(self)
@@ -148,13 +324,16 @@ class Process(multiprocessing.Process):
         self.name = name
         self.logging = cif.logging.getLogger("worker #{0}".format(name))
         self.threads = {}
-        self._stopping = False
+        if threads is None:
+            threads = cif.options.worker_threads_start
+        self.thread_count = multiprocessing.Value('i', threads)
+        self._stopping = multiprocessing.Event()
         self.recycle = False
 
     def run(self):
         """Connects to the backend service, spawns and threads off into worker threads that handle each observable. One
         backend service connection is shared per thread however each connection *is* automatically thread safe due to
-        the backend lock.
+        the backend lock. The number of threads follows :py:attr:`thread_count`.
 
         :return: None
         """
@@ -167,23 +346,43 @@ class Process(multiprocessing.Process):
         self.threads = {}
 
         self.logging.info("Entering worker loop")
-        while True:
-            if not self._stopping:
-                for i in range(1, cif.options.worker_threads_start + 1):
-                    if i not in self.threads or self.threads[i] is None or not self.threads[i].is_alive():
-                        if i in self.threads and self.threads[i] is not None:
-                            self.logging.error("Restarting Worker Thread {0}-{1}".format(self.name, i))
-                        self.threads[i] = Thread(self.name, str(i))
-                        self.threads[i].start()
-            time.sleep(5)
+        while not self._stopping.is_set():
+            target = self.thread_count.value
+            for i in range(1, target + 1):
+                if i not in self.threads or self.threads[i] is None or not self.threads[i].is_alive():
+                    if i in self.threads and self.threads[i] is not None:
+                        self.logging.error("Restarting Worker Thread {0}-{1}".format(self.name, i))
+                    self.threads[i] = Thread(self.name, str(i))
+                    self.threads[i].start()
 
-    def stop(self):
+            extra = [i for i in self.threads.keys() if i > target]
+            if len(extra):
+                self.logging.info("Scaling down to {0} threads".format(target))
+                self._stop_threads(extra)
+
+            self._stopping.wait(5)
+
+        self.logging.info("Stopping")
+        self._stop_threads(list(self.threads.keys()))
+
+    def _stop_threads(self, ids):
         """
-        Stop the worker process and all of it's child threads
+        Stops the given threads and waits for them to flush and exit
+
+        :param list ids: IDs of the threads to stop
         :return: None
         """
-        self._stopping = True
-        for i in range(1, cif.options.worker_threads_start + 1):
-            if i in self.threads and self.threads[i] is not None and self.threads[i].is_alive():
+        for i in ids:
+            if self.threads[i] is not None and self.threads[i].is_alive():
                 self.threads[i].stop()
+        for i in ids:
+            if self.threads[i] is not None:
                 self.threads[i].join()
+            del self.threads[i]
+
+    def stop(self):
+        """
+        Stop the worker process and all of it's child threads. Can be called from the controller process.
+        :return: None
+        """
+        self._stopping.set()